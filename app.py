@@ -1,231 +1,780 @@
-from flask import Flask, request, jsonify
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, Response, stream_with_context, g, send_from_directory
 from flask_cors import CORS
-from supabase import Client, create_client
 from dotenv import load_dotenv
 import os
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-import json
-import bcrypt
+import logging
+import threading
 from datetime import datetime
-import pandas as pd
-from flask_login import LoginManager, UserMixin, login_user
+from flask_login import LoginManager, login_user, logout_user, current_user
+from nlp_processor import NLPProcessor
+from kb_cache import KnowledgeBaseCache
+from history_writer import ChatHistoryWriter
+from response_cache import ResponseCache, create_backend
+from history_pages import ANONYMOUS, fetch_page, iter_rows, parse_fields
+from history_rollups import ROLLUP_TABLE, ROLLUP_FIELDS, summarize
+from password_hasher import PasswordHasher, HasherBusy
+from users import User, UserCache, USER_COLUMNS
+from log_config import configure_logging
+from metrics import registry, stage, db_call, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_TOTAL
+from rate_limit import RateLimiter, create_store
+from functools import wraps
+import json
+import atexit
 
 # Load environment variables
 load_dotenv()
 
-# Download required NLTK data
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
-nltk.download('averaged_perceptron_tagger')
+# Leveled logging through a background thread (LOG_LEVEL, default INFO), unless
+# whatever imported the app already configured the root logger
+configure_logging()
+logger = logging.getLogger('app')
 
 app = Flask(__name__)
-CORS(app)
+# Credentials are allowed so the session cookie set by /api/login reaches /api/chat,
+# which is only safe for origins we serve the front end from (CORS_ORIGINS, comma-separated).
+# The web client is served from / by this app, so the defaults only matter when
+# it is hosted elsewhere.
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv('CORS_ORIGINS', 'http://localhost:5000,http://127.0.0.1:5000').split(',')
+    if origin.strip()
+]
+CORS(app, origins=CORS_ORIGINS, supports_credentials=True)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
 
-# Initialize Supabase client with error handling
+# Set by warm_up() once the database answers; routes return 503 until then
+supabase = None
+kb_cache = None
+history_writer = None
+user_cache = None
+
+# Reported by /api/ready so load balancers only route to warmed-up workers
+startup_state = {
+    'ready': False,
+    'mode': os.getenv('STARTUP_MODE', 'background'),
+    'checks': {
+        'nltk_data': 'pending',
+        'database': 'pending',
+        'knowledge_base': 'pending'
+    },
+    'errors': {},
+    'import_ms': None,
+    'warmup_ms': None
+}
+
+# Initialize Flask-Login
+login_manager = LoginManager()
+login_manager.init_app(app)
+
+@login_manager.user_loader
+def load_user(user_id):
+    # Served from the in-process user cache; only misses hit the users table
+    if not user_cache:
+        return None
+    return user_cache.get(user_id)
+
+nlp_processor = NLPProcessor()
+
+# bcrypt runs in a bounded pool so login bursts can't starve chat requests
+password_hasher = PasswordHasher()
+HASHER_RETRY_AFTER = '1'
+
+# Answers to repeated questions, keyed by the query as the NLP backend sees it and the knowledge base version
+response_cache_ttl = float(os.getenv('RESPONSE_CACHE_TTL', 600))
 try:
+    response_cache_backend = create_backend(response_cache_ttl)
+except Exception as e:
+    logger.error("Error creating shared response cache, using in-process cache only: %s", e)
+    response_cache_backend = None
+response_cache = ResponseCache(ttl=response_cache_ttl, backend=response_cache_backend)
+
+# Per-client token buckets for the chat and auth routes (RATE_LIMIT_* settings)
+try:
+    rate_limit_store = create_store()
+except Exception as e:
+    logger.error("Error creating shared rate limit store, using in-process buckets: %s", e)
+    rate_limit_store = None
+rate_limiter = RateLimiter(rate_limit_store)
+
+def client_key():
+    # Signed-in users get their own bucket; anonymous clients share one per address
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return f'ip:{request.remote_addr}'
+
+def rate_limited(group, cost=None):
+    # 429 with Retry-After once the client's bucket for this group is empty;
+    # every limited response carries the X-RateLimit-* headers (added in
+    # record_request, so error responses get them too). cost() gives the
+    # tokens a request takes, one by default.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            result = rate_limiter.check(group, client_key(), cost() if cost else 1)
+            if result is not None and not result.allowed:
+                return jsonify({'error': 'Too many requests'}), 429, result.headers()
+            g.rate_limit = result
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+def answer_query(user_input, snapshot, top_k=None):
+    # Returns (best response, top-k matches or None), served from the response cache when possible
+    with stage('preprocess'):
+        query = nlp_processor.query_key(user_input)
+    response = response_cache.get_or_compute(
+        ResponseCache.make_key(snapshot.version, query),
+        lambda: nlp_processor.find_best_response(user_input, snapshot.knowledge_base, snapshot.version)
+    )
+    matches = None
+    if top_k:
+        matches = response_cache.get_or_compute(
+            ResponseCache.make_key(snapshot.version, query, f'top{top_k}'),
+            lambda: nlp_processor.search(user_input, snapshot.knowledge_base, snapshot.version, top_k)
+        )
+    return response, matches
+
+STREAM_ALTERNATIVES = 3
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def chat_events(user_input, snapshot, user_id, top_k=None):
+    # Server-sent events for /api/chat/stream: the answer goes out as soon as it
+    # is scored, then its category, score and alternatives, and finally 'done'
+    # once the history row is queued.
+    try:
+        with stage('preprocess'):
+            query = nlp_processor.query_key(user_input)
+        # One scoring pass gives the answer and its metadata, cached like /api/chat answers
+        best = response_cache.get_or_compute(
+            ResponseCache.make_key(snapshot.version, query, 'best'),
+            lambda: nlp_processor.find_best_responses([user_input], snapshot.knowledge_base, snapshot.version)[0]
+        )
+        response = best['response']
+        timestamp = datetime.utcnow().isoformat()
+        yield sse_event('answer', {'response': response, 'timestamp': timestamp})
+
+        top_k = top_k or STREAM_ALTERNATIVES
+        matches = response_cache.get_or_compute(
+            ResponseCache.make_key(snapshot.version, query, f'top{top_k}'),
+            lambda: nlp_processor.search(user_input, snapshot.knowledge_base, snapshot.version, top_k)
+        )
+        yield sse_event('metadata', {
+            'category': best['category'],
+            'score': best['score'],
+            'alternatives': [match for match in matches if match['response'] != response]
+        })
+
+        with stage('history_insert'):
+            history_writer.write({
+                'user_id': user_id,
+                'user_message': user_input,
+                'bot_response': response,
+                'timestamp': timestamp
+            })
+        yield sse_event('done', {})
+    except Exception as e:
+        logger.exception("Error in chat stream")
+        yield sse_event('error', {'error': f'Failed to process message: {str(e)}'})
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Stop nginx from buffering the stream
+    'X-Accel-Buffering': 'no'
+}
+
+# Request handling shared by the Flask routes below and the async ones in
+# asgi.py. The helpers validate, check readiness and build response bodies;
+# each front end only does its own I/O (sync or async client, session cookie)
+# and renders ApiError as {'error': ...} with the given status.
+class ApiError(Exception):
+    def __init__(self, message, status=400, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+def require_ready():
+    # Database-backed routes answer 503 until warm_up() has attached the
+    # database and loaded the knowledge base
+    if not startup_state['ready'] or not supabase:
+        raise ApiError('Database connection not available', 503)
+
+def read_body(data):
+    if not isinstance(data, dict):
+        raise ApiError('Invalid JSON body')
+    return data
+
+def parse_chat_request(data):
+    # (message, top_k) for /api/chat and /api/chat/stream
+    data = read_body(data)
+    user_input = data.get('message')
+    if not isinstance(user_input, str) or not user_input.strip():
+        raise ApiError('message is required')
+    top_k = parse_top_k(data.get('top_k'))
+    if top_k is False:
+        raise ApiError(f'top_k must be an integer between 1 and {MAX_TOP_K}')
+    return user_input, top_k
+
+def chat_reply(user_input, top_k, user_id):
+    # Body of a /api/chat answer. Blocking (knowledge base and NLP), so asgi.py
+    # runs it in its NLP pool.
+    with stage('kb_fetch'):
+        snapshot = kb_cache.get()
+    response, matches = answer_query(user_input, snapshot, top_k)
+
+    # Log conversation (queued, written in the background)
+    with stage('history_insert'):
+        history_writer.write({
+            'user_id': user_id,
+            'user_message': user_input,
+            'bot_response': response,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+
+    result = {
+        'response': response,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    if matches is not None:
+        result['matches'] = matches
+    return result
+
+def parse_batch_request(data):
+    messages = read_body(data).get('messages')
+    if not isinstance(messages, list) or not messages:
+        raise ApiError('messages must be a non-empty list')
+    if len(messages) > MAX_CHAT_BATCH:
+        raise ApiError(f'At most {MAX_CHAT_BATCH} messages per batch')
+    if not all(isinstance(message, str) and message.strip() for message in messages):
+        raise ApiError('Every message must be a non-empty string')
+    return messages
+
+def batch_reply(messages, user_id):
+    with stage('kb_fetch'):
+        snapshot = kb_cache.get()
+
+    # All messages are scored with one transform and one matrix multiply
+    results = nlp_processor.find_best_responses(messages, snapshot.knowledge_base, snapshot.version)
+
+    # One queued item, written as a single multi-row insert
+    timestamp = datetime.utcnow().isoformat()
+    with stage('history_insert'):
+        history_writer.write_many({
+            'user_id': user_id,
+            'user_message': message,
+            'bot_response': result['response'],
+            'timestamp': timestamp
+        } for message, result in zip(messages, results))
+    return {
+        'results': results,
+        'timestamp': timestamp
+    }
+
+def parse_credentials(data):
+    # (email, password) for /api/login and /api/register
+    data = read_body(data)
+    email = data.get('email')
+    password = data.get('password')
+    if not email or not password:
+        raise ApiError('Email and password are required')
+    return email, password
+
+def new_user_row(data, hashed_password):
+    return {
+        'email': data.get('email'),
+        'password': hashed_password,
+        'username': data.get('username')
+    }
+
+def registration_error(e):
+    # The database message isn't passed on; a duplicate is the one users can fix
+    logger.warning("Registration failed: %s", e)
+    if '23505' in str(e):
+        return ApiError('Email or username is already registered', 409)
+    return ApiError('Registration failed')
+
+def user_by_email(client, email):
+    # Query for either Supabase client; the caller executes (or awaits) it
+    return client.table('users').select(f'{USER_COLUMNS}, password').eq('email', email)
+
+def login_candidate(response):
+    if not response.data:
+        logger.debug("Login failed: unknown email")
+        raise ApiError('User not found', 401)
+    return response.data[0]
+
+def complete_login(user_data, password, verified):
+    # Caches the user and upgrades an outdated hash; the caller sets the session
+    if not verified:
+        logger.debug("Login failed: invalid password for user %s", user_data['id'])
+        raise ApiError('Invalid password', 401)
+    user = User(user_data)
+    user_cache.put(user)
+    if password_hasher.needs_rehash(user_data['password']):
+        # BCRYPT_ROUNDS changed since this hash was made; upgrade it in the background
+        password_hasher.rehash_async(password, lambda new_hash: update_password(user.id, new_hash))
+    logger.debug("User %s logged in", user.id)
+    return user
+
+def login_body(user):
+    return {
+        'message': 'Login successful',
+        'user': {
+            'email': user.email,
+            'username': user.username
+        }
+    }
+
+def parse_history_request(args, user_id):
+    # (scope, fields, limit, export) for /api/chat-history; user_id is the
+    # signed-in user's id or None. Signed-in users see their own history; only
+    # they may ask for it by user_id. Anonymous callers only see rows that
+    # belong to nobody, and can't export.
+    requested = args.get('user_id')
+    if user_id:
+        if requested and requested != user_id:
+            raise ApiError('Forbidden', 403)
+        scope = user_id
+    elif requested:
+        raise ApiError('Login required to filter by user_id', 401)
+    else:
+        scope = ANONYMOUS
+
+    try:
+        fields = parse_fields(args.get('fields'))
+        limit = min(int(args.get('limit', 50)), MAX_HISTORY_PAGE)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        raise ApiError(str(e))
+
+    # Export streams every matching row, so it needs a signed-in user
+    export = args.get('format') == 'ndjson'
+    if export and not user_id:
+        raise ApiError('Login required to export chat history', 401)
+    return scope, fields, limit, export
+
+def set_check(name, status, error=None):
+    startup_state['checks'][name] = status
+    if error:
+        startup_state['errors'][name] = error
+    else:
+        startup_state['errors'].pop(name, None)
+
+def connect_supabase():
+    # supabase pulls in the whole HTTP client stack, so import it here rather than at module load
+    from supabase import create_client
+
     supabase_url = os.getenv('SUPABASE_URL')
     supabase_key = os.getenv('SUPABASE_KEY')
     
     if not supabase_url or not supabase_key:
         raise ValueError("Supabase URL or Key not found in environment variables")
     
-    supabase = create_client(supabase_url, supabase_key)
+    client = create_client(supabase_url, supabase_key)
     # Test connection
-    supabase.table('knowledge_base').select('*').limit(1).execute()
-    print("✅ Successfully connected to Supabase")
-except Exception as e:
-    print(f"❌ Error connecting to Supabase: {str(e)}")
-    supabase = None
+    client.table('knowledge_base').select('id').limit(1).execute()
+    return client
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
+def attach_database(client):
+    # Wires every database-backed service to one client; also used by the benchmarks
+    global supabase, kb_cache, history_writer, user_cache
+    # chat_history rows are written in batches by a background thread
+    history_writer = ChatHistoryWriter(client).start()
+    atexit.register(history_writer.stop)
+    # Knowledge base is loaded once and kept in memory; see kb_cache.py for refresh rules.
+    # A changed knowledge base is indexed before requests see it.
+    kb_cache = KnowledgeBaseCache(
+        client,
+        on_refresh=lambda snapshot: nlp_processor.get_index(snapshot.knowledge_base, snapshot.version)
+    ).start()
+    atexit.register(kb_cache.stop)
+    user_cache = UserCache(client)
+    supabase = client
+    set_check('database', 'ok')
 
-class User(UserMixin):
-    def __init__(self, user_data):
-        self.id = user_data['id']
-        self.email = user_data['email']
-        self.username = user_data['username']
+def warm_up(client=None):
+    started = time.perf_counter()
+    retry_interval = float(os.getenv('STARTUP_RETRY_INTERVAL', 5))
 
-@login_manager.user_loader
-def load_user(user_id):
-    response = supabase.table('users').select('*').eq('id', user_id).execute()
-    if response.data:
-        return User(response.data[0])
-    return None
-
-# NLP Processing Class
-class NLPProcessor:
-    def __init__(self):
-        self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
-        self.vectorizer = TfidfVectorizer()
-        
-    def preprocess_text(self, text):
-        # Tokenize
-        tokens = word_tokenize(text.lower())
-        # Remove stop words and lemmatize
-        tokens = [self.lemmatizer.lemmatize(token) for token in tokens 
-                 if token.isalnum() and token not in self.stop_words]
-        return ' '.join(tokens)
-
-    def find_best_response(self, user_input, knowledge_base):
-        processed_input = self.preprocess_text(user_input)
-        all_responses = []
-        categories = []
-        
-        for category, data in knowledge_base.items():
-            for response in data['responses']:
-                all_responses.append(response)
-                categories.append(category)
-        
-        if not all_responses:
-            return "I'm still learning about supply chain management. Please try asking about inventory, logistics, procurement, or forecasting."
-        
-        # Create TF-IDF matrix
-        tfidf_matrix = self.vectorizer.fit_transform([processed_input] + all_responses)
-        
-        # Calculate similarity scores
-        similarity_scores = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])
-        best_match_index = np.argmax(similarity_scores)
-        
-        if similarity_scores[0][best_match_index] < 0.1:
-            return "I'm not sure about that. Could you please rephrase your question about supply chain management?"
-            
-        return all_responses[best_match_index]
+    # NLTK data is provisioned by setup_nltk.py; only check for it here, never download
+    from setup_nltk import verify_nltk_data
+    missing = verify_nltk_data()
+    if missing:
+        set_check('nltk_data', 'error', f"Missing NLTK data: {', '.join(missing)}. Run python setup_nltk.py")
+        logger.error("Missing NLTK data: %s. Run python setup_nltk.py", ', '.join(missing))
+        return
+    nlp_processor.warm_up()
+    set_check('nltk_data', 'ok')
 
-nlp_processor = NLPProcessor()
+    while client is None:
+        try:
+            client = connect_supabase()
+        except ValueError as e:
+            # Missing credentials won't fix themselves, so don't retry
+            set_check('database', 'error', str(e))
+            logger.error("Error connecting to Supabase: %s", e)
+            return
+        except Exception as e:
+            set_check('database', 'error', str(e))
+            logger.error("Error connecting to Supabase, retrying in %gs: %s", retry_interval, e)
+            time.sleep(retry_interval)
+            continue
+        logger.info("Successfully connected to Supabase")
+    attach_database(client)
+
+    while True:
+        try:
+            # Loads the knowledge base and builds its index (on_refresh)
+            snapshot = kb_cache.refresh()
+            set_check('knowledge_base', 'ok')
+            logger.info("Loaded %d knowledge base categories", len(snapshot.knowledge_base))
+            break
+        except Exception as e:
+            set_check('knowledge_base', 'error', str(e))
+            logger.error("Error loading knowledge base, retrying in %gs: %s", retry_interval, e)
+            time.sleep(retry_interval)
+
+    startup_state['warmup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    startup_state['ready'] = True
+    logger.info("Ready in %s ms (import took %s ms)", startup_state['warmup_ms'], startup_state['import_ms'])
+
+MAX_TOP_K = 50
+
+def parse_top_k(value, default=None):
+    # None when absent, False when invalid, otherwise an int in [1, MAX_TOP_K]
+    if value is None or value == '':
+        return default
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        return False
+    if top_k < 1 or top_k > MAX_TOP_K:
+        return False
+    return top_k
+
+def update_password(user_id, new_hash):
+    with db_call('users', 'update'):
+        supabase.table('users').update({'password': new_hash}).eq('id', user_id).execute()
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.errorhandler(ApiError)
+def api_error(e):
+    return jsonify({'error': str(e)}), e.status, e.headers
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': HASHER_RETRY_AFTER}
+
+@app.after_request
+def record_request(response):
+    rate_limit = g.pop('rate_limit', None)
+    if rate_limit is not None:
+        response.headers.extend(rate_limit.headers())
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS_TOTAL.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+def collect_service_metrics():
+    # Gauges read from the caches and background workers at scrape time
+    samples = [('app_ready', 'Whether warm-up has finished.', None, int(startup_state['ready']))]
+    if history_writer:
+        stats = history_writer.stats()
+        samples += [
+            ('chat_history_queue_depth', 'Rows waiting to be written to chat_history.', None, stats['queue_depth']),
+            ('chat_history_rows', 'chat_history writer row counts by outcome.', {'outcome': 'written'}, stats['written']),
+            ('chat_history_rows', 'chat_history writer row counts by outcome.', {'outcome': 'dropped'}, stats['dropped']),
+            ('chat_history_rows', 'chat_history writer row counts by outcome.', {'outcome': 'spilled'}, stats['spilled']),
+            ('chat_history_last_flush_seconds', 'Duration of the latest chat_history flush.', None,
+             stats['last_flush_ms'] / 1000 if stats['last_flush_ms'] is not None else None),
+        ]
+    cache_stats = response_cache.stats()
+    samples += [
+        ('response_cache_hit_ratio', 'Share of chat answers served from the response cache.', None, cache_stats['hit_ratio']),
+        ('response_cache_latency_saved_seconds', 'Estimated time saved by response cache hits.', None,
+         cache_stats['latency_saved_ms'] / 1000 if cache_stats['latency_saved_ms'] is not None else None),
+        ('response_cache_coalesced', 'Chat answers that waited on an identical in-flight computation.', None,
+         cache_stats['coalesced']),
+    ]
+    limiter_stats = rate_limiter.stats()
+    samples += [
+        ('rate_limited_requests', 'Requests rejected with 429 by route group.', {'group': group}, count)
+        for group, count in limiter_stats['limited'].items()
+    ]
+    samples.append(('rate_limit_store_errors', 'Rate limit checks that failed open.', None, limiter_stats['store_errors']))
+    nlp_stats = nlp_processor.cache_stats()
+    samples += [
+        ('nlp_cache_hit_ratio', 'Preprocessing cache hit ratio.', {'cache': 'query'}, nlp_stats['query_cache']['hit_ratio']),
+        ('nlp_cache_hit_ratio', 'Preprocessing cache hit ratio.', {'cache': 'lemma'}, nlp_stats['lemma_cache']['hit_ratio']),
+    ]
+    hasher_stats = password_hasher.stats()
+    samples += [
+        ('auth_hash_in_flight', 'bcrypt jobs running or queued.', None, hasher_stats['in_flight']),
+        ('auth_hash_rejected', 'bcrypt jobs rejected because the pool was saturated.', None, hasher_stats['rejected']),
+    ]
+    if user_cache:
+        samples.append(('user_cache_hit_ratio', 'Flask-Login user cache hit ratio.', None, user_cache.stats()['hit_ratio']))
+    return samples
+
+registry.register_collector(collect_service_metrics)
 
 # Routes
+# The web client (index.html, script.js, styles.css), served from the app's own
+# origin so it works with the default CORS_ORIGINS
+UI_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@app.route('/')
+def index():
+    return send_from_directory(UI_DIR, 'index.html')
+
+@app.route('/<any(script.js, styles.css):filename>')
+def ui_file(filename):
+    return send_from_directory(UI_DIR, filename)
+
 @app.route('/api/register', methods=['POST'])
+@rate_limited('auth')
 def register():
-    data = request.json
-    email = data.get('email')
-    password = data.get('password')
-    username = data.get('username')
-    
-    # Hash password
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    require_ready()
+    data = request.get_json(silent=True)
+    email, password = parse_credentials(data)
+    hashed_password = password_hasher.hash(password)
     
     try:
-        response = supabase.table('users').insert({
-            'email': email,
-            'password': hashed_password.decode('utf-8'),
-            'username': username
-        }).execute()
-        
-        return jsonify({'message': 'User registered successfully'}), 201
+        with db_call('users', 'insert'):
+            supabase.table('users').insert(new_user_row(data, hashed_password)).execute()
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        raise registration_error(e)
+    return jsonify({'message': 'User registered successfully'}), 201
 
 @app.route('/api/login', methods=['POST'])
+@rate_limited('auth')
 def login():
-    data = request.json
-    email = data.get('email')
-    password = data.get('password')
-    
-    if not email or not password:
-        return jsonify({'error': 'Email and password are required'}), 400
+    require_ready()
+    email, password = parse_credentials(request.get_json(silent=True))
     
     try:
         # Query user from Supabase
-        print(f"Attempting to login user: {email}")  # Debug log
-        response = supabase.table('users').select('*').eq('email', email).execute()
-        
-        if not response.data:
-            print(f"No user found with email: {email}")  # Debug log
-            return jsonify({'error': 'User not found'}), 401
-            
-        user_data = response.data[0]
-        
-        try:
-            # Verify password
-            if bcrypt.checkpw(password.encode('utf-8'), user_data['password'].encode('utf-8')):
-                user = User(user_data)
-                login_user(user)
-                print(f"User logged in successfully: {email}")  # Debug log
-                return jsonify({
-                    'message': 'Login successful',
-                    'user': {
-                        'email': user.email,
-                        'username': user.username
-                    }
-                }), 200
-            else:
-                print(f"Invalid password for user: {email}")  # Debug log
-                return jsonify({'error': 'Invalid password'}), 401
-        except Exception as e:
-            print(f"Password verification error: {str(e)}")  # Debug log
-            return jsonify({'error': 'Password verification failed'}), 500
-            
-    except Exception as e:
-        print(f"Login error: {str(e)}")  # Debug log
-        return jsonify({'error': str(e)}), 500
+        with db_call('users', 'select'):
+            response = user_by_email(supabase, email).execute()
+    except Exception:
+        logger.exception("Login error")
+        return jsonify({'error': 'Login failed'}), 500
+    user_data = login_candidate(response)
+    
+    try:
+        # Verify password
+        verified = password_hasher.verify(password, user_data['password'])
+    except HasherBusy:
+        raise
+    except Exception:
+        logger.exception("Password verification error")
+        return jsonify({'error': 'Password verification failed'}), 500
+    
+    user = complete_login(user_data, password, verified)
+    login_user(user)
+    return jsonify(login_body(user)), 200
+
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    if current_user.is_authenticated:
+        if user_cache:
+            user_cache.invalidate(current_user.id)
+        logout_user()
+    return jsonify({'message': 'Logged out'}), 200
+
+def current_user_id():
+    return current_user.id if current_user.is_authenticated else None
 
 @app.route('/api/chat', methods=['POST'])
+@rate_limited('chat')
 def chat():
-    if not supabase:
-        return jsonify({'error': 'Database connection not available'}), 503
-        
-    data = request.json
-    user_input = data.get('message')
+    require_ready()
+    user_input, top_k = parse_chat_request(request.get_json(silent=True))
     
     try:
-        # Load knowledge base from Supabase
-        response = supabase.table('knowledge_base').select('*').execute()
-        knowledge_base = {}
-        for item in response.data:
-            knowledge_base[item['category']] = {
-                'keywords': item['keywords'],
-                'responses': item['responses']
-            }
+        result = chat_reply(user_input, top_k, current_user_id())
+        with stage('serialize'):
+            return jsonify(result)
+    except Exception as e:
+        logger.exception("Error in chat endpoint")
+        return jsonify({'error': f'Failed to process message: {str(e)}'}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+@rate_limited('chat')
+def chat_stream():
+    require_ready()
+    user_input, top_k = parse_chat_request(request.get_json(silent=True))
         
-        # Process message using NLP
-        response = nlp_processor.find_best_response(user_input, knowledge_base)
+    try:
+        with stage('kb_fetch'):
+            snapshot = kb_cache.get()
+    except Exception as e:
+        logger.exception("Error in chat stream endpoint")
+        return jsonify({'error': f'Failed to process message: {str(e)}'}), 500
         
-        # Log conversation with anonymous user
-        try:
-            supabase.table('chat_history').insert({
-                'user_message': user_input,
-                'bot_response': response,
-                'timestamp': datetime.utcnow().isoformat()
-            }).execute()
-        except Exception as e:
-            print(f"Warning: Failed to log chat history: {str(e)}")
-            # Continue even if logging fails
+    return Response(
+        stream_with_context(chat_events(user_input, snapshot, current_user_id(), top_k)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+MAX_CHAT_BATCH = int(os.getenv('CHAT_BATCH_MAX', 500))
+
+def batch_cost():
+    # chat_batch is limited per message, so a batch costs what its messages
+    # would on /api/chat; malformed bodies take one token and get a 400
+    data = request.get_json(silent=True)
+    messages = data.get('messages') if isinstance(data, dict) else None
+    return len(messages) if isinstance(messages, list) and messages else 1
+
+@app.route('/api/chat/batch', methods=['POST'])
+@rate_limited('chat_batch', cost=batch_cost)
+def chat_batch():
+    require_ready()
+    messages = parse_batch_request(request.get_json(silent=True))
+        
+    try:
+        result = batch_reply(messages, current_user_id())
+        with stage('serialize'):
+            return jsonify(result)
+    except Exception as e:
+        logger.exception("Error in chat batch endpoint")
+        return jsonify({'error': f'Failed to process messages: {str(e)}'}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    require_ready()
+        
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    top_k = parse_top_k(request.args.get('top_k'), default=5)
+    if top_k is False:
+        return jsonify({'error': f'top_k must be an integer between 1 and {MAX_TOP_K}'}), 400
         
+    try:
+        snapshot = kb_cache.get()
+        results = response_cache.get_or_compute(
+            ResponseCache.make_key(snapshot.version, nlp_processor.query_key(query), f'top{top_k}'),
+            lambda: nlp_processor.search(query, snapshot.knowledge_base, snapshot.version, top_k)
+        )
         return jsonify({
-            'response': response,
-            'timestamp': datetime.utcnow().isoformat()
+            'query': query,
+            'results': results
         })
     except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
-        return jsonify({'error': f'Failed to process message: {str(e)}'}), 500
+        logger.exception("Error in search endpoint")
+        return jsonify({'error': f'Failed to search knowledge base: {str(e)}'}), 500
+
+@app.route('/api/knowledge-base/invalidate', methods=['POST'])
+def invalidate_knowledge_base():
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({'error': 'Forbidden'}), 403
+    if not kb_cache:
+        return jsonify({'error': 'Database connection not available'}), 503
+        
+    kb_cache.invalidate()
+    return jsonify({'message': 'Knowledge base cache invalidated'}), 202
+
+@app.route('/api/history-writer/stats')
+def history_writer_stats():
+    if not history_writer:
+        return jsonify({'error': 'Database connection not available'}), 503
+    return jsonify(history_writer.stats())
+
+@app.route('/api/nlp/stats')
+def nlp_stats():
+    return jsonify(nlp_processor.cache_stats())
+
+@app.route('/api/auth/user-cache/stats')
+def user_cache_stats():
+    if not user_cache:
+        return jsonify({'error': 'Database connection not available'}), 503
+    return jsonify(user_cache.stats())
+
+@app.route('/api/auth/hasher/stats')
+def hasher_stats():
+    return jsonify(password_hasher.stats())
+
+@app.route('/api/response-cache/stats')
+def response_cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/api/rate-limit/stats')
+def rate_limit_stats():
+    return jsonify(rate_limiter.stats())
+
+MAX_HISTORY_PAGE = 200
 
 @app.route('/api/chat-history', methods=['GET'])
 def get_chat_history():
+    require_ready()
+    user_id, fields, limit, export = parse_history_request(request.args, current_user_id())
+        
+    if export:
+        # Stream every matching row, one JSON object per line
+        def generate():
+            try:
+                for row in iter_rows(supabase, fields, user_id=user_id):
+                    yield json.dumps(row) + '\n'
+            except Exception as e:
+                logger.exception("Error streaming chat history")
+                yield json.dumps({'error': f'Failed to fetch chat history: {str(e)}'}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    try:
+        rows, next_cursor = fetch_page(supabase, fields, limit, request.args.get('cursor'), user_id)
+        return jsonify({
+            'messages': rows,
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error fetching chat history")
+        return jsonify({'error': f'Failed to fetch chat history: {str(e)}'}), 500
+
+MAX_ANALYTICS_DAYS = 366
+
+@app.route('/api/analytics/daily', methods=['GET'])
+def daily_analytics():
+    # Reads the daily rollups only, so the cost doesn't grow with chat_history
     if not supabase:
         return jsonify({'error': 'Database connection not available'}), 503
         
     try:
-        response = supabase.table('chat_history')\
-            .select('*')\
-            .order('timestamp', desc=True)\
-            .limit(50)\
-            .execute()
-            
-        return jsonify(response.data)
+        days = int(request.args.get('days', 30))
+        if days < 1 or days > MAX_ANALYTICS_DAYS:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'days must be an integer between 1 and {MAX_ANALYTICS_DAYS}'}), 400
+        
+    try:
+        with db_call(ROLLUP_TABLE, 'select'):
+            response = supabase.table(ROLLUP_TABLE).select(','.join(ROLLUP_FIELDS))\
+                .order('day', desc=True).limit(days).execute()
+        rollups = response.data
+        for rollup in rollups:
+            rollup['unmatched_rate'] = rollup['unmatched'] / rollup['messages'] if rollup['messages'] else None
+        return jsonify({
+            'days': rollups,
+            'totals': summarize(rollups)
+        })
     except Exception as e:
-        print(f"Error fetching chat history: {str(e)}")
-        return jsonify({'error': f'Failed to fetch chat history: {str(e)}'}), 500
+        logger.exception("Error fetching analytics")
+        return jsonify({'error': f'Failed to fetch analytics: {str(e)}'}), 500
 
 @app.route('/api/check-tables')
 def check_tables():
@@ -234,13 +783,28 @@ def check_tables():
         
     try:
         # Check knowledge_base table
-        kb_response = supabase.table('knowledge_base').select('*').limit(1).execute()
+        with db_call('knowledge_base', 'select'):
+            kb_response = supabase.table('knowledge_base').select('*').limit(1).execute()
         kb_exists = len(kb_response.data) >= 0
         
         # Check chat_history table
-        ch_response = supabase.table('chat_history').select('*').limit(1).execute()
+        with db_call('chat_history', 'select'):
+            ch_response = supabase.table('chat_history').select('*').limit(1).execute()
         ch_exists = len(ch_response.data) >= 0
         
+        # Latest daily rollup (see compact_history.py); optional, so a missing
+        # table is reported rather than failing the whole check
+        try:
+            with db_call(ROLLUP_TABLE, 'select'):
+                rollup_response = supabase.table(ROLLUP_TABLE).select(','.join(ROLLUP_FIELDS))\
+                    .order('day', desc=True).limit(1).execute()
+            rollup_exists = True
+            rollup_sample = rollup_response.data
+        except Exception as e:
+            logger.warning("Error checking %s: %s", ROLLUP_TABLE, e)
+            rollup_exists = False
+            rollup_sample = []
+        
         return jsonify({
             'status': 'success',
             'tables': {
@@ -251,17 +815,48 @@ def check_tables():
                 'chat_history': {
                     'exists': ch_exists,
                     'sample_data': ch_response.data
+                },
+                ROLLUP_TABLE: {
+                    'exists': rollup_exists,
+                    'sample_data': rollup_sample
                 }
             }
         })
     except Exception as e:
-        print(f"Error checking tables: {str(e)}")
+        logger.exception("Error checking tables")
         return jsonify({'error': f'Failed to check tables: {str(e)}'}), 500
 
+@app.route('/metrics')
+def metrics():
+    # Prometheus text exposition format
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health')
+def health():
+    # Liveness: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+@app.route('/api/ready')
+def ready():
+    # Readiness: NLTK data found, database reachable and knowledge base indexed
+    return jsonify(startup_state), 200 if startup_state['ready'] else 503
+
 @app.route('/')
 def home():
     status = "✅ Connected to Supabase" if supabase else "❌ Not connected to Supabase"
     return f'Flask backend is running. Database status: {status}'
 
+# Import stays cheap: database probe, knowledge base load and index build run in
+# the background unless STARTUP_MODE=blocking. A background warm-up thread doesn't
+# survive a fork, so a server that imports the app before forking needs blocking mode
+# (the history writer and log listener restart their threads in each worker).
+# STARTUP_MODE=manual leaves it to the caller to run warm_up(), e.g. with a fake client.
+startup_state['import_ms'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+if startup_state['mode'] == 'blocking':
+    warm_up()
+elif startup_state['mode'] != 'manual':
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    # Development server only; use serve.py in production
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1') 
\ No newline at end of file
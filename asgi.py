@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as chatbot
+from async_db import create_async_client
+from history_pages import fetch_page_async, iter_rows_async
+from metrics import stage, db_call, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_TOTAL
+from password_hasher import HasherBusy
+
+# Async front end for the Flask app. /api/chat, /api/chat/stream,
+# /api/chat-history and the auth routes run on the event loop: database calls go
+# through one pooled async PostgREST client and NLP runs in a thread pool, so an
+# open connection costs a coroutine rather than a thread. Validation, readiness
+# and response bodies come from the request helpers in app.py, so both front
+# ends answer alike. Everything else is served by the Flask app.
+logger = logging.getLogger('asgi')
+
+flask_app = chatbot.app
+# Set in lifespan(); routes return 503 until then
+db = None
+nlp_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('NLP_WORKERS', os.cpu_count() or 1)),
+    thread_name_prefix='nlp'
+)
+
+# Flask-Login keeps the user id in Flask's signed session cookie. Reading and
+# writing the same cookie here lets a login on either server be used by both.
+SESSION_KEYS = ('_user_id', '_fresh', '_id', '_remember')
+
+
+def load_session(request):
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return {}
+
+
+def save_session(response, session):
+    name = flask_app.config['SESSION_COOKIE_NAME']
+    if not session:
+        response.delete_cookie(name, path='/')
+        return
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    response.set_cookie(
+        name,
+        serializer.dumps(dict(session)),
+        path='/',
+        httponly=flask_app.config['SESSION_COOKIE_HTTPONLY'],
+        secure=flask_app.config['SESSION_COOKIE_SECURE'],
+        samesite=flask_app.config['SESSION_COOKIE_SAMESITE'] or 'lax'
+    )
+
+
+async def current_user(request):
+    user_id = load_session(request).get('_user_id')
+    if not user_id or not chatbot.user_cache or db is None:
+        return None
+    return await chatbot.user_cache.get_async(user_id, db)
+
+
+def require_ready():
+    chatbot.require_ready()
+    if db is None:
+        raise chatbot.ApiError('Database connection not available', 503)
+
+
+async def call(handler, request):
+    # Renders the errors the shared request helpers raise, like the Flask
+    # app's error handlers
+    try:
+        return await handler(request)
+    except chatbot.ApiError as e:
+        return JSONResponse({'error': str(e)}, e.status, e.headers)
+    except HasherBusy as e:
+        return JSONResponse({'error': str(e)}, 503, {'Retry-After': chatbot.HASHER_RETRY_AFTER})
+
+
+def timed(route):
+    # Same request metrics the Flask app records in its after_request hook
+    def decorator(handler):
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await call(handler, request)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+            HTTP_REQUESTS_TOTAL.inc(route=route, method=request.method, status=response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+
+def client_key(request):
+    # Matches app.client_key(); the signed session cookie is enough to tell users apart
+    user_id = load_session(request).get('_user_id')
+    if user_id:
+        return f'user:{user_id}'
+    return f'ip:{request.client.host if request.client else None}'
+
+
+def limited(group):
+    # Async counterpart of app.rate_limited(); shared stores do blocking I/O, so
+    # their checks run in the NLP pool
+    def decorator(handler):
+        async def wrapper(request):
+            key = client_key(request)
+            if chatbot.rate_limiter.store.blocking:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(nlp_executor, chatbot.rate_limiter.check, group, key)
+            else:
+                result = chatbot.rate_limiter.check(group, key)
+            if result is None:
+                return await call(handler, request)
+            if not result.allowed:
+                return JSONResponse({'error': 'Too many requests'}, 429, result.headers())
+            response = await call(handler, request)
+            response.headers.update(result.headers())
+            return response
+        return wrapper
+    return decorator
+
+
+async def read_json(request):
+    # None for a missing or malformed body; the shared parsers reject it
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def user_id_of(request):
+    user = await current_user(request)
+    return user.id if user else None
+
+
+@timed('/api/register')
+@limited('auth')
+async def register(request):
+    require_ready()
+    data = await read_json(request)
+    email, password = chatbot.parse_credentials(data)
+    hashed_password = await chatbot.password_hasher.hash_async(password)
+
+    try:
+        with db_call('users', 'insert'):
+            await db.table('users').insert(chatbot.new_user_row(data, hashed_password)).execute()
+    except Exception as e:
+        raise chatbot.registration_error(e)
+    return JSONResponse({'message': 'User registered successfully'}, 201)
+
+
+@timed('/api/login')
+@limited('auth')
+async def login(request):
+    require_ready()
+    email, password = chatbot.parse_credentials(await read_json(request))
+
+    try:
+        with db_call('users', 'select'):
+            response = await chatbot.user_by_email(db, email).execute()
+    except Exception:
+        logger.exception("Login error")
+        return JSONResponse({'error': 'Login failed'}, 500)
+    user_data = chatbot.login_candidate(response)
+
+    try:
+        verified = await chatbot.password_hasher.verify_async(password, user_data['password'])
+    except HasherBusy:
+        raise
+    except Exception:
+        logger.exception("Password verification error")
+        return JSONResponse({'error': 'Password verification failed'}, 500)
+
+    # A rehash runs in the hasher pool; the sync client is fine off the event loop
+    user = chatbot.complete_login(user_data, password, verified)
+    result = JSONResponse(chatbot.login_body(user), 200)
+    session = load_session(request)
+    session.update({'_user_id': user.get_id(), '_fresh': True})
+    save_session(result, session)
+    return result
+
+
+@timed('/api/logout')
+async def logout(request):
+    session = load_session(request)
+    user_id = session.get('_user_id')
+    if user_id and chatbot.user_cache:
+        chatbot.user_cache.invalidate(user_id)
+    for key in SESSION_KEYS:
+        session.pop(key, None)
+    result = JSONResponse({'message': 'Logged out'}, 200)
+    save_session(result, session)
+    return result
+
+
+@timed('/api/chat')
+@limited('chat')
+async def chat(request):
+    require_ready()
+    user_input, top_k = chatbot.parse_chat_request(await read_json(request))
+
+    try:
+        user_id = await user_id_of(request)
+        loop = asyncio.get_running_loop()
+        # The knowledge base lookup and the NLP are blocking
+        result = await loop.run_in_executor(nlp_executor, chatbot.chat_reply, user_input, top_k, user_id)
+        with stage('serialize'):
+            return JSONResponse(result)
+    except Exception as e:
+        logger.exception("Error in chat endpoint")
+        return JSONResponse({'error': f'Failed to process message: {str(e)}'}, 500)
+
+
+@timed('/api/chat/stream')
+@limited('chat')
+async def chat_stream(request):
+    require_ready()
+    user_input, top_k = chatbot.parse_chat_request(await read_json(request))
+
+    user_id = await user_id_of(request)
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(nlp_executor, chatbot.kb_cache.get)
+    except Exception as e:
+        logger.exception("Error in chat stream endpoint")
+        return JSONResponse({'error': f'Failed to process message: {str(e)}'}, 500)
+
+    async def generate():
+        # Each step of the shared event generator runs in the NLP pool; the
+        # connection itself is just a coroutine waiting on the next event
+        events = chatbot.chat_events(user_input, snapshot, user_id, top_k)
+        while True:
+            event = await loop.run_in_executor(nlp_executor, next, events, None)
+            if event is None:
+                return
+            yield event
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=chatbot.SSE_HEADERS)
+
+
+@timed('/api/chat-history')
+async def get_chat_history(request):
+    require_ready()
+    args = request.query_params
+    user_id, fields, limit, export = chatbot.parse_history_request(args, await user_id_of(request))
+
+    if export:
+        # Stream every matching row, one JSON object per line
+        async def generate():
+            try:
+                async for row in iter_rows_async(db, fields, user_id=user_id):
+                    yield json.dumps(row) + '\n'
+            except Exception as e:
+                logger.exception("Error streaming chat history")
+                yield json.dumps({'error': f'Failed to fetch chat history: {str(e)}'}) + '\n'
+        return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+    try:
+        rows, next_cursor = await fetch_page_async(db, fields, limit, args.get('cursor'), user_id)
+        return JSONResponse({
+            'messages': rows,
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, 400)
+    except Exception as e:
+        logger.exception("Error fetching chat history")
+        return JSONResponse({'error': f'Failed to fetch chat history: {str(e)}'}, 500)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global db
+    try:
+        db = create_async_client()
+    except ValueError as e:
+        logger.error("Async database client not created: %s", e)
+    yield
+    if db is not None:
+        await db.aclose()
+        db = None
+    nlp_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/register', register, methods=['POST']),
+        Route('/api/login', login, methods=['POST']),
+        Route('/api/logout', logout, methods=['POST']),
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chat/stream', chat_stream, methods=['POST']),
+        Route('/api/chat-history', get_chat_history, methods=['GET']),
+        # Everything else (stats, search, health, /metrics, ...) stays on Flask
+        Mount('/', app=WSGIMiddleware(flask_app))
+    ],
+    lifespan=lifespan
+)
+# Same allowed origins as the Flask app, so the session cookie is only sent from them
+app.add_middleware(CORSMiddleware, allow_origins=chatbot.CORS_ORIGINS, allow_credentials=True,
+                   allow_methods=['*'], allow_headers=['*'])
@@ -0,0 +1,36 @@
+import os
+
+import httpx
+from postgrest import AsyncPostgrestClient
+
+
+def create_async_client(supabase_url=None, supabase_key=None, pool_size=None, keepalive=None, timeout=None):
+    # PostgREST client for the async server. Every request shares one httpx
+    # connection pool, so thousands of open chat connections need at most
+    # SUPABASE_POOL_SIZE sockets to the database API.
+    supabase_url = supabase_url or os.getenv('SUPABASE_URL')
+    supabase_key = supabase_key or os.getenv('SUPABASE_KEY')
+    if not supabase_url or not supabase_key:
+        raise ValueError("Supabase URL or Key not found in environment variables")
+
+    rest_url = f"{supabase_url.rstrip('/')}/rest/v1"
+    client = AsyncPostgrestClient(rest_url, headers={
+        'apikey': supabase_key,
+        'Authorization': f'Bearer {supabase_key}',
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    })
+    limits = httpx.Limits(
+        max_connections=int(pool_size or os.getenv('SUPABASE_POOL_SIZE', 100)),
+        max_keepalive_connections=int(keepalive or os.getenv('SUPABASE_POOL_KEEPALIVE', 20))
+    )
+    # The pinned postgrest client doesn't take pool limits, so swap in a session
+    # built with them; it has made no connections yet, so nothing is leaked.
+    client.session = httpx.AsyncClient(
+        base_url=rest_url,
+        headers=client.session.headers,
+        timeout=float(timeout or os.getenv('SUPABASE_TIMEOUT', 10)),
+        limits=limits,
+        follow_redirects=True
+    )
+    return client
@@ -0,0 +1,81 @@
+"""Micro-benchmark for NLPProcessor.preprocess_text.
+
+Compares the NLTK (Punkt) and regex tokenizer modes, cold and with the query
+cache warm, and reports any knowledge base response where the two modes
+disagree.
+
+    python benchmarks/bench_preprocess.py --rounds 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp_processor import NLPProcessor
+from populate_knowledge_base import knowledge_base
+
+SAMPLE_QUESTIONS = [
+    "What is inventory turnover?",
+    "Track my shipment",
+    "How do I pick a reliable supplier?",
+    "Can you forecast demand for next quarter?",
+    "How can we reduce our carbon emissions?",
+    "What's the best way to cut transportation costs?",
+    "Help me plan for supply chain disruptions",
+    "Which software should we use for warehouse automation?",
+    "How do I set up quality inspection checkpoints?",
+    "Let's talk about real-time inventory tracking",
+]
+
+
+def kb_texts():
+    return [response for data in knowledge_base.values() for response in data['responses']]
+
+
+def time_calls(func, texts, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text)
+    elapsed = time.perf_counter() - started
+    return elapsed / (rounds * len(texts)) * 1e6
+
+
+def bench_mode(tokenizer, texts, rounds):
+    processor = NLPProcessor(tokenizer=tokenizer)
+    # Cold: bypass the query cache so every call tokenizes and lemmatizes
+    cold_us = time_calls(lambda t: processor._preprocess(processor.normalize(t)), texts, rounds)
+    processor.query_cache.clear()
+    warm_us = time_calls(processor.preprocess_text, texts, rounds)
+    return processor, cold_us, warm_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    texts = SAMPLE_QUESTIONS + kb_texts()
+    results = {}
+    for tokenizer in ('nltk', 'regex'):
+        processor, cold_us, warm_us = bench_mode(tokenizer, texts, args.rounds)
+        results[tokenizer] = processor
+        stats = processor.cache_stats()
+        print(f"{tokenizer:>5}: cold {cold_us:8.1f} us/text   cached {warm_us:6.1f} us/text   "
+              f"query hit ratio {stats['query_cache']['hit_ratio']:.2f}   "
+              f"lemma hit ratio {stats['lemma_cache']['hit_ratio']:.2f}")
+
+    mismatches = [
+        text for text in texts
+        if results['nltk'].preprocess_text(text) != results['regex'].preprocess_text(text)
+    ]
+    print(f"tokenizer agreement: {len(texts) - len(mismatches)}/{len(texts)} texts")
+    for text in mismatches:
+        print(f"  nltk : {results['nltk'].preprocess_text(text)}")
+        print(f"  regex: {results['regex'].preprocess_text(text)}")
+
+
+if __name__ == '__main__':
+    main()
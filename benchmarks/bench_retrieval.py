@@ -0,0 +1,145 @@
+"""Compares the retrieval backends of NLPProcessor (NLP_BACKEND).
+
+Answer quality is measured on the built-in supply chain knowledge base with
+paraphrased questions that have a known category. Index build time, index size
+and per-query latency are measured on synthetic knowledge bases.
+
+    python benchmarks/bench_retrieval.py --sizes 1000,10000,100000
+    python benchmarks/bench_retrieval.py --backends tfidf,lsa,lsa-int8,lsa-int8-ann,transformer
+
+The transformer backend needs requirements-transformer.txt and a local copy of
+NLP_EMBEDDING_MODEL.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from nlp_processor import NLPProcessor, knowledge_base_version
+from populate_knowledge_base import knowledge_base
+from synthetic_kb import generate_knowledge_base, generate_queries
+
+# Questions that share few or no words with the answers they should get
+PARAPHRASES = [
+    ("stock running low", 'inventory'),
+    ("we keep running out of products on the shelves", 'inventory'),
+    ("how much product is sitting in our storage facility", 'inventory'),
+    ("when should we place a new order for items", 'inventory'),
+    ("where is my package right now", 'logistics'),
+    ("the truck carrying our goods is late", 'logistics'),
+    ("cheapest way to ship pallets overseas", 'logistics'),
+    ("final leg of getting parcels to customers", 'logistics'),
+    ("which company should supply our raw materials", 'procurement'),
+    ("how good are the firms we buy from", 'procurement'),
+    ("renegotiate terms with the people we purchase from", 'procurement'),
+    ("how many units will customers want next month", 'forecasting'),
+    ("predict sales for the holiday season", 'forecasting'),
+    ("plan ahead for busy months", 'forecasting'),
+    ("too many broken items coming off the line", 'quality_control'),
+    ("make sure products meet regulations", 'quality_control'),
+    ("checking goods for faults before shipping", 'quality_control'),
+    ("lower our pollution", 'sustainability'),
+    ("eco friendly boxes and wrapping", 'sustainability'),
+    ("reuse materials instead of throwing them away", 'sustainability'),
+    ("what if a port closes or a supplier fails", 'risk_management'),
+    ("backup plan for emergencies", 'risk_management'),
+    ("spend less money on moving goods", 'cost_optimization'),
+    ("where are we wasting money", 'cost_optimization'),
+    ("sensors to follow items through the warehouse", 'technology_integration'),
+    ("replace manual work with robots", 'technology_integration'),
+    ("which platform should we buy to run operations", 'technology_integration'),
+]
+
+# name -> (NLP_BACKEND, environment overrides)
+BACKENDS = {
+    'tfidf': ('tfidf', {}),
+    'lsa': ('lsa', {'NLP_EMBEDDING_DTYPE': 'float32', 'NLP_ANN_MIN_ROWS': '1000000000'}),
+    'lsa-int8': ('lsa', {'NLP_EMBEDDING_DTYPE': 'int8', 'NLP_ANN_MIN_ROWS': '1000000000'}),
+    'lsa-int8-ann': ('lsa', {'NLP_EMBEDDING_DTYPE': 'int8', 'NLP_ANN_MIN_ROWS': '1'}),
+    'transformer': ('transformer', {'NLP_EMBEDDING_DTYPE': 'float32', 'NLP_ANN_MIN_ROWS': '1000000000'}),
+}
+
+
+def make_processor(name):
+    backend, overrides = BACKENDS[name]
+    os.environ.update(overrides)
+    return NLPProcessor(tokenizer='regex', backend=backend)
+
+
+def index_bytes(index):
+    # Everything that would be published to NLP_INDEX_DIR, i.e. shared between workers
+    _, arrays = index.export()
+    return sum(array.nbytes for array in arrays.values())
+
+
+def quality(name):
+    processor = make_processor(name)
+    version = knowledge_base_version(knowledge_base)
+    results = processor.find_best_responses([q for q, _ in PARAPHRASES], knowledge_base, version)
+    correct = sum(r['category'] == expected for r, (_, expected) in zip(results, PARAPHRASES))
+    answered = sum(r['category'] is not None for r in results)
+    return correct, answered
+
+
+def performance(name, size, queries):
+    processor = make_processor(name)
+    kb = generate_knowledge_base(size)
+    version = knowledge_base_version(kb)
+    started = time.perf_counter()
+    index = processor.get_index(kb, version)
+    build_s = time.perf_counter() - started
+
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        processor.find_best_response(query, kb, version)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'build_s': build_s,
+        'index_mb': index_bytes(index) / 1e6,
+        'p50_ms': statistics.median(samples),
+        'p99_ms': samples[min(len(samples) - 1, int(0.99 * len(samples)))]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='tfidf,lsa,lsa-int8,lsa-int8-ann')
+    parser.add_argument('--sizes', default='1000,10000')
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.backends.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(unknown)}")
+
+    print(f"Answer quality on {len(PARAPHRASES)} paraphrased questions:")
+    for name in names:
+        try:
+            correct, answered = quality(name)
+        except ImportError as e:
+            print(f"  {name:<14} skipped ({e})")
+            continue
+        print(f"  {name:<14} correct category {correct:>3}/{len(PARAPHRASES)}   answered {answered:>3}/{len(PARAPHRASES)}")
+
+    queries = generate_queries(args.queries)
+    for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        print(f"\nKnowledge base with {size} responses:")
+        for name in names:
+            try:
+                result = performance(name, size, queries)
+            except ImportError as e:
+                print(f"  {name:<14} skipped ({e})")
+                continue
+            print(f"  {name:<14} build {result['build_s']:7.2f} s   index {result['index_mb']:8.2f} MB   "
+                  f"p50 {result['p50_ms']:7.3f} ms   p99 {result['p99_ms']:7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Cold start benchmark for app.py.
+
+Imports the app in fresh interpreters and reports how long the import takes
+and how long the background warm-up needs before /api/ready would return 200.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+deadline = imported + {timeout}
+while not app.startup_state['ready'] and not app.startup_state['errors'] and time.perf_counter() < deadline:
+    time.sleep(0.01)
+print(json.dumps({{
+    'import_s': imported - started,
+    'ready_s': time.perf_counter() - started if app.startup_state['ready'] else None,
+    'errors': app.startup_state['errors']
+}}))
+"""
+
+
+def run_once(timeout):
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(timeout=timeout)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(label, values):
+    if not values:
+        print(f"{label:>8}: n/a")
+        return
+    print(f"{label:>8}: median {statistics.median(values) * 1000:7.1f} ms   "
+          f"min {min(values) * 1000:7.1f} ms   max {max(values) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for readiness')
+    args = parser.parse_args()
+
+    runs = [run_once(args.timeout) for _ in range(args.runs)]
+    summarize('import', [r['import_s'] for r in runs])
+    summarize('ready', [r['ready_s'] for r in runs if r['ready_s'] is not None])
+    errors = [r['errors'] for r in runs if r['errors']]
+    if errors:
+        print(f"warm-up errors: {errors[-1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""In-memory stand-in for the supabase client.
+
+Covers the part of the PostgREST query builder that the app uses:
+table().select/insert/upsert/update/eq/lt/is_/order/limit/range/execute, plus
+select(count='exact'). An optional per-call latency models the network round
+trip so benchmarks can show what moving calls off the hot path buys.
+"""
+import copy
+import itertools
+import threading
+import time
+import uuid
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = 'select'
+        self.columns = None
+        self.count = None
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.orders = []
+        self.offset = 0
+        self.max_rows = None
+
+    def select(self, columns='*', count=None):
+        self.action = 'select'
+        self.columns = None if columns.strip() == '*' else [c.strip() for c in columns.split(',')]
+        self.count = count
+        return self
+
+    def insert(self, rows):
+        self.action = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict='', **kwargs):
+        self.action = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict or 'id'
+        return self
+
+    def update(self, values):
+        self.action = 'update'
+        self.payload = values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def is_(self, column, value):
+        # Only the "is null" form is used
+        self.filters.append(lambda row: row.get(column) is None)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.max_rows = size
+        return self
+
+    def range(self, start, end):
+        self.offset = start
+        self.max_rows = end - start + 1
+        return self
+
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def _project(self, row):
+        if self.columns is None:
+            return dict(row)
+        return {column: row.get(column) for column in self.columns}
+
+    def execute(self):
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.calls[self.table] = self.client.calls.get(self.table, 0) + 1
+            rows = self.client.tables.setdefault(self.table, [])
+            if self.action == 'insert':
+                inserted = [self.client.new_row(self.table, row) for row in self.payload]
+                rows.extend(inserted)
+                return FakeResponse(copy.deepcopy(inserted))
+            if self.action == 'upsert':
+                by_key = {row.get(self.on_conflict): row for row in rows}
+                written = []
+                for row in self.payload:
+                    existing = by_key.get(row.get(self.on_conflict))
+                    if existing is not None:
+                        existing.update(copy.deepcopy(row))
+                        written.append(existing)
+                    else:
+                        created = self.client.new_row(self.table, row)
+                        rows.append(created)
+                        by_key[created.get(self.on_conflict)] = created
+                        written.append(created)
+                return FakeResponse(copy.deepcopy(written))
+            if self.action == 'update':
+                updated = [row for row in rows if self._matches(row)]
+                for row in updated:
+                    row.update(copy.deepcopy(self.payload))
+                return FakeResponse(copy.deepcopy(updated))
+
+            matched = [row for row in rows if self._matches(row)]
+            total = len(matched)
+            # Stable sorts applied last-key-first give multi-column ORDER BY
+            for column, desc in reversed(self.orders):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column) or ''), reverse=desc)
+            end = None if self.max_rows is None else self.offset + self.max_rows
+            data = [self._project(row) for row in matched[self.offset:end]]
+            return FakeResponse(data, total if self.count else None)
+
+
+class FakeSupabase:
+    def __init__(self, tables=None, latency=0.0):
+        self.tables = tables or {}
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = {}
+        self._clock = itertools.count()
+
+    def new_row(self, table, row):
+        row = copy.deepcopy(row)
+        row.setdefault('id', str(uuid.uuid4()))
+        if table == 'knowledge_base':
+            # Monotonic stand-in for the updated_at trigger in setup_db.py
+            row['updated_at'] = f"{next(self._clock):012d}"
+        return row
+
+    def table(self, name):
+        return FakeQuery(self, name)
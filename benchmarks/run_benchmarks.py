@@ -0,0 +1,250 @@
+"""Benchmark suite for the chat pipeline against an in-memory Supabase stand-in.
+
+For each synthetic knowledge base size it measures NLPProcessor.preprocess_text,
+find_best_response, building vs. attaching to a shared index, and the end-to-end
+/api/chat, /api/chat/batch, /api/login and /api/chat-history routes, and writes
+latency percentiles and throughput as JSON so runs can be compared:
+
+    python benchmarks/run_benchmarks.py --sizes 10,1000,10000 --output bench.json
+    python benchmarks/run_benchmarks.py --sizes 10,1000,10000 --baseline bench.json
+
+Requires the NLTK data from setup_nltk.py. Network latency to Supabase can be
+simulated with --latency (seconds per database call).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The benchmark wires app.py to the fake client itself
+os.environ.setdefault('STARTUP_MODE', 'manual')
+# Load comes from one client, so per-client rate limits would turn it into 429s
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+from fake_supabase import FakeSupabase
+from index_store import IndexStore
+from nlp_processor import NLPProcessor
+from synthetic_kb import generate_knowledge_base, knowledge_base_rows, generate_queries, generate_history
+
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = 'benchmark-password'
+BENCH_USER_ID = '00000000-0000-0000-0000-000000000001'
+
+
+def summarize(name, size, samples_ms, wall_s):
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'name': name,
+        'kb_size': size,
+        'n': len(ordered),
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': pct(50),
+        'p90_ms': pct(90),
+        'p99_ms': pct(99),
+        'max_ms': ordered[-1],
+        'throughput_rps': len(ordered) / wall_s if wall_s else None
+    }
+
+
+def measure(name, size, func, items, concurrency=1):
+    def timed(item):
+        started = time.perf_counter()
+        func(item)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(timed, items))
+    else:
+        samples = [timed(item) for item in items]
+    return summarize(name, size, samples, time.perf_counter() - started)
+
+
+def expect_ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def run_size(app, size, args):
+    knowledge_base = generate_knowledge_base(size)
+    users = [{
+        'id': BENCH_USER_ID,
+        'email': BENCH_EMAIL,
+        'username': 'bench',
+        'password': app.password_hasher.hash(BENCH_PASSWORD)
+    }]
+    fake = FakeSupabase({
+        'knowledge_base': knowledge_base_rows(knowledge_base),
+        'users': users,
+        'chat_history': generate_history(args.history_rows, [BENCH_USER_ID, None])
+    }, latency=args.latency)
+
+    if app.history_writer:
+        app.history_writer.stop()
+    if app.kb_cache:
+        app.kb_cache.stop()
+    app.response_cache.clear()
+    started = time.perf_counter()
+    app.warm_up(fake)
+    if not app.startup_state['ready']:
+        raise RuntimeError(f"Warm-up failed: {app.startup_state['errors']}")
+    results = [summarize('warm_up', size, [(time.perf_counter() - started) * 1000], 0)]
+
+    snapshot = app.kb_cache.get()
+    processor = app.nlp_processor
+    queries = generate_queries(args.requests)
+
+    processor.query_cache.clear()
+    results.append(measure('preprocess_text_cold', size, processor.preprocess_text, queries))
+    results.append(measure('preprocess_text_cached', size, processor.preprocess_text, queries))
+    results.append(measure(
+        'find_best_response', size,
+        lambda q: processor.find_best_response(q, snapshot.knowledge_base, snapshot.version), queries
+    ))
+
+    # Cold index in one worker vs. attaching to the generation it published (NLP_INDEX_DIR)
+    with tempfile.TemporaryDirectory() as directory:
+        store = IndexStore(directory)
+        results.append(measure(
+            'index_build_publish', size,
+            lambda _: NLPProcessor(tokenizer=processor.tokenizer, index_store=store)
+                .get_index(snapshot.knowledge_base, snapshot.version),
+            range(1)
+        ))
+        results.append(measure(
+            'index_attach', size,
+            lambda _: NLPProcessor(tokenizer=processor.tokenizer, index_store=store)
+                .get_index(snapshot.knowledge_base, snapshot.version),
+            range(5)
+        ))
+
+    client = app.app.test_client()
+    app.response_cache.clear()
+    chat_queries = generate_queries(args.requests, seed=size)
+    results.append(measure(
+        'api_chat', size,
+        lambda q: expect_ok(app.app.test_client().post('/api/chat', json={'message': q})),
+        chat_queries, args.concurrency
+    ))
+    # Same queries through /api/chat/batch, 50 per request (throughput is batches/s)
+    app.response_cache.clear()
+    results.append(measure(
+        'api_chat_batch50', size,
+        lambda batch: expect_ok(app.app.test_client().post('/api/chat/batch', json={'messages': batch})),
+        [chat_queries[i:i + 50] for i in range(0, len(chat_queries), 50)]
+    ))
+    repeated = generate_queries(args.requests, seed=size, distinct=max(1, args.requests // 20))
+    results.append(measure(
+        'api_chat_repeated', size,
+        lambda q: expect_ok(app.app.test_client().post('/api/chat', json={'message': q})),
+        repeated, args.concurrency
+    ))
+
+    results.append(measure(
+        'api_login', size,
+        lambda _: expect_ok(app.app.test_client().post(
+            '/api/login', json={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}
+        )),
+        range(args.login_requests), args.concurrency
+    ))
+
+    expect_ok(client.post('/api/login', json={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}))
+    cursors = [None]
+
+    def history_page(_):
+        cursor = cursors[-1]
+        url = '/api/chat-history?limit=50' + (f'&cursor={cursor}' if cursor else '')
+        data = expect_ok(client.get(url)).get_json()
+        cursors.append(data['next_cursor'])
+
+    results.append(measure('api_chat_history_page', size, history_page, range(args.history_pages)))
+    app.history_writer.stop()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['name'], r['kb_size']): r for r in json.load(f)['results']}
+    regressions = 0
+    print(f"\n{'benchmark':<24}{'kb':>8}{'p50 before':>12}{'p50 now':>10}{'change':>9}")
+    for result in results:
+        before = baseline.get((result['name'], result['kb_size']))
+        if not before or not before['p50_ms']:
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms']
+        flag = '  REGRESSION' if change > threshold else ''
+        regressions += bool(flag)
+        print(f"{result['name']:<24}{result['kb_size']:>8}{before['p50_ms']:>12.3f}"
+              f"{result['p50_ms']:>10.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='comma-separated KB sizes, in responses (up to 100000)')
+    parser.add_argument('--requests', type=int, default=200, help='queries per chat/NLP benchmark')
+    parser.add_argument('--login-requests', type=int, default=20)
+    parser.add_argument('--history-rows', type=int, default=10000)
+    parser.add_argument('--history-pages', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads for the HTTP benchmarks')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per database call')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 slowdown reported as a regression')
+    args = parser.parse_args()
+
+    import app
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        print(f"Benchmarking knowledge base with {size} responses...")
+        for result in run_size(app, size, args):
+            results.append(result)
+            print(f"  {result['name']:<24} p50 {result['p50_ms']:9.3f} ms   p99 {result['p99_ms']:9.3f} ms"
+                  + (f"   {result['throughput_rps']:9.1f} req/s" if result['throughput_rps'] else ''))
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        sys.exit(1 if compare(results, args.baseline, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
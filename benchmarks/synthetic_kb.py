@@ -0,0 +1,69 @@
+"""Synthetic supply chain knowledge bases and queries for benchmarks."""
+import random
+from datetime import datetime, timedelta
+
+TOPICS = [
+    'inventory', 'warehouse', 'stock', 'shipment', 'delivery', 'route', 'carrier', 'freight',
+    'supplier', 'vendor', 'contract', 'sourcing', 'procurement', 'forecast', 'demand', 'seasonality',
+    'quality', 'inspection', 'defect', 'compliance', 'carbon', 'packaging', 'recycling', 'emission',
+    'risk', 'disruption', 'contingency', 'resilience', 'cost', 'budget', 'savings', 'efficiency',
+    'automation', 'software', 'integration', 'sensor', 'tracking', 'reorder', 'turnover', 'backlog',
+]
+VERBS = ['analyze', 'optimize', 'reduce', 'track', 'improve', 'automate', 'monitor', 'forecast', 'negotiate', 'audit']
+OBJECTS = ['levels', 'times', 'costs', 'performance', 'metrics', 'capacity', 'accuracy', 'routes', 'plans', 'reports']
+OPENERS = ['I can help', "Let's", 'Our system can', 'Based on current data, we should', 'I recommend we']
+
+
+def generate_knowledge_base(n_responses, responses_per_category=5, seed=42):
+    rng = random.Random(seed)
+    knowledge_base = {}
+    n_categories = max(1, (n_responses + responses_per_category - 1) // responses_per_category)
+    remaining = n_responses
+    for c in range(n_categories):
+        keywords = rng.sample(TOPICS, 4)
+        responses = []
+        for _ in range(min(responses_per_category, remaining)):
+            topic = rng.choice(keywords)
+            other = rng.choice(TOPICS)
+            responses.append(
+                f"{rng.choice(OPENERS)} {rng.choice(VERBS)} {topic} {rng.choice(OBJECTS)} "
+                f"and {rng.choice(VERBS)} {other} {rng.choice(OBJECTS)} (ref {c}-{len(responses)})."
+            )
+        remaining -= len(responses)
+        knowledge_base[f"{keywords[0]}_{c}"] = {'keywords': keywords, 'responses': responses}
+    return knowledge_base
+
+
+def knowledge_base_rows(knowledge_base):
+    return [
+        {'category': category, 'keywords': data['keywords'], 'responses': data['responses']}
+        for category, data in knowledge_base.items()
+    ]
+
+
+def generate_queries(n_queries, seed=7, distinct=None):
+    # distinct limits the pool of unique questions, to model repeated traffic
+    rng = random.Random(seed)
+    pool_size = distinct or n_queries
+    pool = [
+        f"how do we {rng.choice(VERBS)} {rng.choice(TOPICS)} {rng.choice(OBJECTS)} for {rng.choice(TOPICS)}?"
+        for _ in range(pool_size)
+    ]
+    return [pool[i % pool_size] if distinct else pool[i] for i in range(n_queries)]
+
+
+HISTORY_START = datetime(2024, 1, 1)
+
+
+def generate_history(n_rows, user_ids, seed=11):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': f"{i:012d}",
+            'user_id': rng.choice(user_ids),
+            'user_message': f"question {i}",
+            'bot_response': f"answer {i}",
+            'timestamp': (HISTORY_START + timedelta(seconds=i)).isoformat()
+        }
+        for i in range(n_rows)
+    ]
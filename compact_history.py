@@ -0,0 +1,241 @@
+from dotenv import load_dotenv
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from supabase import create_client
+
+from history_rollups import ROLLUP_FIELDS, ROLLUP_TABLE, ResponseCatalog, merge_rollups, rollup_day
+
+# Load environment variables
+load_dotenv()
+
+# Retention job for chat_history, meant to run daily (cron or similar):
+#  - every complete day that has no rollup yet gets a row in chat_history_daily
+#  - days older than HISTORY_RETENTION_DAYS are written to one compressed file
+#    per day in HISTORY_ARCHIVE_DIR and then deleted from chat_history; their
+#    rollup is recomputed from the rows being archived first, so rows that
+#    arrived after the day was rolled up are still counted
+# Archived rows keep a response id instead of the bot_response text; the ids
+# resolve through responses.json in the same directory.
+ARCHIVE_COLUMNS = ('id', 'user_id', 'user_message', 'response_id', 'bot_response', 'timestamp')
+CATALOG_FILE = 'responses.json'
+
+
+def get_client():
+    return create_client(
+        os.getenv('SUPABASE_URL'),
+        os.getenv('SUPABASE_KEY')
+    )
+
+
+def load_knowledge_base(supabase, page_size=1000):
+    knowledge_base = {}
+    start = 0
+    while True:
+        response = supabase.table('knowledge_base')\
+            .select('category, responses')\
+            .order('category')\
+            .range(start, start + page_size - 1)\
+            .execute()
+        for item in response.data:
+            knowledge_base[item['category']] = {'responses': item['responses']}
+        if len(response.data) < page_size:
+            return knowledge_base
+        start += page_size
+
+
+def day_bounds(day):
+    return f'{day.isoformat()}T00:00:00', f'{(day + timedelta(days=1)).isoformat()}T00:00:00'
+
+
+def fetch_day(supabase, day, page_size=1000):
+    # A finished day no longer changes, so plain offset paging is stable here
+    start_ts, end_ts = day_bounds(day)
+    rows = []
+    while True:
+        response = supabase.table('chat_history')\
+            .select('id, user_id, user_message, bot_response, timestamp')\
+            .gte('timestamp', start_ts)\
+            .lt('timestamp', end_ts)\
+            .order('timestamp')\
+            .order('id')\
+            .range(len(rows), len(rows) + page_size - 1)\
+            .execute()
+        rows += response.data
+        if len(response.data) < page_size:
+            return rows
+
+
+def oldest_day(supabase):
+    response = supabase.table('chat_history').select('timestamp').order('timestamp').limit(1).execute()
+    if not response.data:
+        return None
+    return date.fromisoformat(response.data[0]['timestamp'][:10])
+
+
+def existing_rollups(supabase, since):
+    response = supabase.table(ROLLUP_TABLE)\
+        .select(','.join(ROLLUP_FIELDS))\
+        .gte('day', since.isoformat())\
+        .execute()
+    return {date.fromisoformat(item['day']): item for item in response.data}
+
+
+def archive_rows(rows, catalog):
+    # Known responses become ids; text the knowledge base no longer has is kept as is
+    archived = []
+    for row in rows:
+        rid, _ = catalog.lookup(row['bot_response'])
+        archived.append({
+            'id': row['id'],
+            'user_id': row.get('user_id'),
+            'user_message': row['user_message'],
+            'response_id': rid,
+            'bot_response': None if rid else row['bot_response'],
+            'timestamp': row['timestamp']
+        })
+    return archived
+
+
+def archive_path(directory, day, archive_format):
+    # Rows that reach an already archived day get a file of their own
+    extension = 'parquet' if archive_format == 'parquet' else 'jsonl.gz'
+    path = os.path.join(directory, f'chat_history-{day.isoformat()}.{extension}')
+    part = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f'chat_history-{day.isoformat()}.{part}.{extension}')
+        part += 1
+    return path
+
+
+def write_archive(directory, day, rows, archive_format):
+    # Written to a temporary name and renamed, so a crash never leaves half a file
+    # behind that a later run would skip
+    path = archive_path(directory, day, archive_format)
+    if archive_format == 'parquet':
+        import pandas as pd
+
+        pd.DataFrame(rows, columns=ARCHIVE_COLUMNS).to_parquet(path + '.tmp', compression='gzip', index=False)
+    else:
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def update_catalog(directory, catalog):
+    # Every response text any archive refers to, merged with earlier runs so
+    # ids stay resolvable after the knowledge base is edited
+    path = os.path.join(directory, CATALOG_FILE)
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+    entries.update(catalog.entries)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def delete_rows(supabase, rows, chunk_size=200):
+    # By id rather than by time range, so rows that arrive late (e.g. replayed
+    # from the history writer's spill file) are never deleted unarchived
+    ids = [row['id'] for row in rows]
+    for start in range(0, len(ids), chunk_size):
+        supabase.table('chat_history').delete().in_('id', ids[start:start + chunk_size]).execute()
+
+
+def compact_history(retention_days=None, archive_dir=None, archive_format=None, dry_run=False, today=None):
+    retention_days = int(retention_days if retention_days is not None else os.getenv('HISTORY_RETENTION_DAYS', 90))
+    archive_dir = archive_dir or os.getenv('HISTORY_ARCHIVE_DIR', 'chat_history_archive')
+    archive_format = archive_format or os.getenv('HISTORY_ARCHIVE_FORMAT', 'jsonl')
+    if archive_format not in ('jsonl', 'parquet'):
+        raise ValueError(f"Unknown archive format: {archive_format}")
+
+    try:
+        supabase = get_client()
+        today = today or datetime.utcnow().date()
+        cutoff = today - timedelta(days=retention_days)
+        first = oldest_day(supabase)
+        if first is None:
+            print("ℹ️ chat_history is empty, nothing to do")
+            return {'rolled_up': 0, 'archived_days': 0, 'archived_rows': 0}
+
+        catalog = ResponseCatalog(load_knowledge_base(supabase))
+        rollups = existing_rollups(supabase, first)
+        if not dry_run:
+            os.makedirs(archive_dir, exist_ok=True)
+
+        started = time.perf_counter()
+        counts = {'rolled_up': 0, 'archived_days': 0, 'archived_rows': 0}
+        catalog_written = False
+        day = first
+        # Today is still being written to, so it waits for tomorrow's run
+        while day < today:
+            archive = day < cutoff
+            existing = rollups.get(day)
+            if existing is not None and not archive:
+                day += timedelta(days=1)
+                continue
+            rows = fetch_day(supabase, day)
+            rollup = None
+            if existing is None or (archive and rows):
+                rollup = rollup_day(day.isoformat(), rows, catalog)
+                # Rows still here for an archived day arrived after it was archived
+                late = existing is not None and existing['archived']
+                if late:
+                    rollup = merge_rollups(existing, rollup)
+                rollup['archived'] = late
+                counts['rolled_up'] += 1
+            if archive and rows:
+                counts['archived_days'] += 1
+                counts['archived_rows'] += len(rows)
+
+            if dry_run:
+                print(f"{day}: {len(rows)} rows" + (", roll up" if rollup else "") + (", archive" if archive else ""))
+            else:
+                if rollup:
+                    supabase.table(ROLLUP_TABLE).upsert(rollup, on_conflict='day').execute()
+                if archive and rows:
+                    if not catalog_written:
+                        # The catalog only depends on the knowledge base, so one write
+                        # covers every archive; it lands before any row is deleted
+                        update_catalog(archive_dir, catalog)
+                        catalog_written = True
+                    path = write_archive(archive_dir, day, archive_rows(rows, catalog), archive_format)
+                    delete_rows(supabase, rows)
+                    supabase.table(ROLLUP_TABLE).update({'archived': True}).eq('day', day.isoformat()).execute()
+                    print(f"✅ Archived {len(rows)} rows from {day} to {path}")
+            day += timedelta(days=1)
+
+        elapsed = time.perf_counter() - started
+        summary = (f"{counts['rolled_up']} days rolled up, "
+                   f"{counts['archived_rows']} rows from {counts['archived_days']} days archived")
+        if dry_run:
+            print(f"ℹ️ Dry run: {summary} (nothing written)")
+        else:
+            print(f"✅ Compacted chat history in {elapsed:.2f}s: {summary}")
+        return counts
+
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Roll up chat_history by day and archive old rows to local files.')
+    parser.add_argument('--retention-days', type=int, help='days of raw history kept in the database (HISTORY_RETENTION_DAYS)')
+    parser.add_argument('--archive-dir', help='directory for archived days (HISTORY_ARCHIVE_DIR)')
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), help='gzip JSONL (default) or Parquet via pandas')
+    parser.add_argument('--dry-run', action='store_true', help='show what would be rolled up and archived without writing')
+    args = parser.parse_args()
+    if compact_history(args.retention_days, args.archive_dir, args.format, dry_run=args.dry_run) is None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
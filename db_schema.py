@@ -0,0 +1,37 @@
+import os
+
+# The DDL lives in schema.sql and has to be run by hand (SQL editor or psql):
+# the PostgREST API these scripts talk to can't execute it. These checks make
+# the scripts stop with that instruction instead of failing halfway through.
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+# Columns added after the original schema, per table
+REQUIRED_COLUMNS = {
+    'knowledge_base': ('category', 'content_hash', 'updated_at')
+}
+
+
+class SchemaError(Exception):
+    pass
+
+
+def run_schema_message(problem):
+    return f"{problem}. Run {SCHEMA_FILE} in the Supabase SQL editor (or psql -f schema.sql) first"
+
+
+def check_schema(supabase, tables=None):
+    # Raises SchemaError naming the first table or column that is missing
+    for table in tables or REQUIRED_COLUMNS:
+        columns = REQUIRED_COLUMNS[table]
+        try:
+            supabase.table(table).select(', '.join(columns)).limit(1).execute()
+        except Exception as e:
+            raise SchemaError(run_schema_message(f"{table} is missing columns from schema.sql ({e})"))
+
+
+def explain_upsert_error(error, table, column):
+    # PostgreSQL rejects ON CONFLICT without a unique constraint on the target (42P10)
+    message = str(error)
+    if '42P10' in message or 'ON CONFLICT' in message:
+        return SchemaError(run_schema_message(f"{table}.{column} has no unique constraint"))
+    return error
@@ -0,0 +1,320 @@
+import importlib.util
+import os
+
+import numpy as np
+
+from index_store import pack_postings, unpack_postings
+
+# Dense retrieval backends for NLPProcessor (NLP_BACKEND=lsa or transformer).
+# Responses are embedded once per knowledge base version into a row-normalised
+# float32 (or int8) matrix, so a query is one vectorized dot product; an IVF
+# index narrows that to a few clusters for large knowledge bases.
+
+# Dense cosines run higher than TF-IDF ones for unrelated text
+DENSE_SIMILARITY_THRESHOLD = 0.3
+# Rows cast to float32 at a time when scoring an int8 matrix
+SCORE_BLOCK_ROWS = 65536
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LSAEncoder:
+    # TF-IDF followed by truncated SVD (latent semantic analysis), fitted on the
+    # knowledge base itself. Gives a compact dense matrix that can be int8
+    # quantized and IVF-searched on large knowledge bases. It does not answer
+    # paraphrases better than TF-IDF on the shipped knowledge base (see
+    # benchmarks/bench_retrieval.py); the transformer backend is the one for that.
+    name = 'lsa'
+    # Encodes the lemmatized, stop-word-free text that TF-IDF uses
+    uses_processed_text = True
+    # Optional packages beyond requirements.txt
+    requires = ()
+    # At most this share of the response count: with about as many dimensions
+    # as responses the SVD is only a rotation of the TF-IDF space and ranks the same
+    max_dimension_ratio = 0.25
+
+    def __init__(self, dimensions=None):
+        self.dimensions = int(dimensions or os.getenv('NLP_LSA_DIMENSIONS', 256))
+        self.vocabulary = None
+        self.idf = None
+        self.components = None
+        self._vectorizer = None
+
+    @property
+    def tag(self):
+        return f'lsa{self.dimensions}'
+
+    def fit(self, texts):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(sublinear_tf=True)
+        matrix = vectorizer.fit_transform(texts)
+        dimensions = min(self.dimensions, int(matrix.shape[0] * self.max_dimension_ratio), matrix.shape[1] - 1)
+        if dimensions < 1:
+            # Too small to factorize; the TF-IDF space itself is the embedding
+            self.components = np.eye(matrix.shape[1], dtype=np.float32)
+        else:
+            svd = TruncatedSVD(n_components=dimensions, random_state=0)
+            svd.fit(matrix)
+            self.components = svd.components_.astype(np.float32)
+        self._vectorizer = vectorizer
+        self.vocabulary = vectorizer.vocabulary_
+        self.idf = vectorizer.idf_
+        return self
+
+    def encode(self, texts):
+        return normalize_rows(self._vectorizer.transform(texts) @ self.components.T)
+
+    def export(self):
+        return (
+            {'encoder': self.name, 'dimensions': self.dimensions,
+             'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get)},
+            {'lsa_idf': self.idf, 'lsa_components': self.components}
+        )
+
+    @classmethod
+    def attach(cls, meta, arrays):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        encoder = cls(meta['dimensions'])
+        vectorizer = TfidfVectorizer(sublinear_tf=True)
+        vectorizer.vocabulary_ = {term: i for i, term in enumerate(meta['vocabulary'])}
+        vectorizer.idf_ = np.asarray(arrays['lsa_idf'])
+        encoder._vectorizer = vectorizer
+        encoder.vocabulary = vectorizer.vocabulary_
+        encoder.idf = vectorizer.idf_
+        encoder.components = arrays['lsa_components']
+        return encoder
+
+
+class TransformerEncoder:
+    # Mean-pooled sentence embeddings from a small local transformer model
+    # (NLP_EMBEDDING_MODEL). Needs the torch package; set TRANSFORMERS_OFFLINE=1
+    # to load only from the local model cache.
+    name = 'transformer'
+    uses_processed_text = False
+    requires = ('torch', 'transformers')
+
+    def __init__(self, model_name=None, batch_size=None):
+        self.model_name = model_name or os.getenv('NLP_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+        self.batch_size = int(batch_size or os.getenv('NLP_EMBEDDING_BATCH_SIZE', 32))
+        self._tokenizer = None
+        self._model = None
+
+    @property
+    def tag(self):
+        return 'transformer-' + self.model_name.replace('/', '_')
+
+    def _load(self):
+        if self._model is None:
+            from transformers import AutoModel, AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            self._model = AutoModel.from_pretrained(self.model_name).eval()
+        return self._tokenizer, self._model
+
+    def fit(self, texts):
+        self._load()
+        return self
+
+    def encode(self, texts):
+        import torch
+
+        tokenizer, model = self._load()
+        batches = []
+        with torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                inputs = tokenizer(
+                    list(texts[start:start + self.batch_size]),
+                    padding=True, truncation=True, max_length=256, return_tensors='pt'
+                )
+                hidden = model(**inputs).last_hidden_state
+                mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                batches.append(pooled.numpy())
+        return normalize_rows(np.concatenate(batches))
+
+    def export(self):
+        return {'encoder': self.name, 'model': self.model_name}, {}
+
+    @classmethod
+    def attach(cls, meta, arrays):
+        return cls(meta['model'])
+
+
+ENCODERS = {
+    LSAEncoder.name: LSAEncoder,
+    TransformerEncoder.name: TransformerEncoder
+}
+
+
+def missing_dependencies(backend):
+    # Checked when the backend is chosen, so a missing package fails at startup
+    # rather than on the first index build
+    return [name for name in ENCODERS[backend].requires if importlib.util.find_spec(name) is None]
+
+
+def create_encoder(backend):
+    if backend not in ENCODERS:
+        raise ValueError(f"Unknown NLP backend: {backend}")
+    return ENCODERS[backend]()
+
+
+class EmbeddingMatrix:
+    # Row-normalised response embeddings, either float32 or int8 codes with a
+    # float32 scale per row (a quarter of the memory, cosines within ~1%).
+    def __init__(self, vectors=None, codes=None, scales=None):
+        self.vectors = vectors
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def from_vectors(cls, vectors, dtype='float32'):
+        if dtype == 'float32':
+            return cls(vectors=np.ascontiguousarray(vectors, dtype=np.float32))
+        if dtype != 'int8':
+            raise ValueError(f"Unknown embedding dtype: {dtype}")
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return cls(codes=codes, scales=scales.astype(np.float32))
+
+    @property
+    def dtype(self):
+        return 'float32' if self.vectors is not None else 'int8'
+
+    @property
+    def shape(self):
+        return (self.vectors if self.vectors is not None else self.codes).shape
+
+    @property
+    def nbytes(self):
+        if self.vectors is not None:
+            return self.vectors.nbytes
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, queries, rows=None):
+        # (len(rows) or n_responses) x n_queries cosine similarities
+        if rows is not None:
+            if self.vectors is not None:
+                return self.vectors[rows] @ queries.T
+            return (self.codes[rows].astype(np.float32) @ queries.T) * self.scales[rows, None]
+        if self.vectors is not None:
+            return self.vectors @ queries.T
+        # Cast block by block so an int8 matrix is never expanded in full
+        out = np.empty((self.codes.shape[0], queries.shape[0]), dtype=np.float32)
+        for start in range(0, self.codes.shape[0], SCORE_BLOCK_ROWS):
+            end = start + SCORE_BLOCK_ROWS
+            out[start:end] = (self.codes[start:end].astype(np.float32) @ queries.T) * self.scales[start:end, None]
+        return out
+
+    def export(self):
+        if self.vectors is not None:
+            return {'embeddings': self.vectors}
+        return {'embedding_codes': self.codes, 'embedding_scales': self.scales}
+
+    @classmethod
+    def attach(cls, arrays):
+        if 'embeddings' in arrays:
+            return cls(vectors=arrays['embeddings'])
+        return cls(codes=arrays['embedding_codes'], scales=arrays['embedding_scales'])
+
+
+class IVFIndex:
+    # Approximate nearest neighbours by inverted file: responses are clustered
+    # with k-means, and a query is scored only against the members of its
+    # nprobe closest clusters.
+    def __init__(self, centroids, offsets, rows, nprobe=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.nprobe = min(int(nprobe or os.getenv('NLP_ANN_NPROBE', 8)), len(centroids))
+
+    @classmethod
+    def build(cls, vectors, n_lists=None):
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_lists = int(n_lists or os.getenv('NLP_ANN_LISTS', 0)) or max(1, int(np.sqrt(len(vectors))))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=0, n_init=3, batch_size=4096)
+        labels = kmeans.fit_predict(vectors)
+        centroids = normalize_rows(kmeans.cluster_centers_)
+        rows = np.argsort(labels, kind='stable').astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids, offsets, rows)
+
+    def candidates(self, query):
+        # Sorted row ids from the clusters closest to the query
+        similarity = self.centroids @ query
+        if self.nprobe < len(similarity):
+            probe = np.argpartition(-similarity, self.nprobe - 1)[:self.nprobe]
+        else:
+            probe = np.arange(len(similarity))
+        return np.sort(np.concatenate([self.rows[self.offsets[c]:self.offsets[c + 1]] for c in probe]))
+
+    def export(self):
+        return {'ann_centroids': self.centroids, 'ann_offsets': self.offsets, 'ann_rows': self.rows}
+
+    @classmethod
+    def attach(cls, arrays):
+        if 'ann_centroids' not in arrays:
+            return None
+        return cls(arrays['ann_centroids'], arrays['ann_offsets'], arrays['ann_rows'])
+
+
+class EmbeddingIndex:
+    # Dense counterpart of ResponseIndex: one immutable snapshot per KB version
+    kind = 'embedding'
+
+    def __init__(self, version, encoder, matrix, responses, categories, keyword_postings=None, ann=None,
+                 threshold=None):
+        self.version = version
+        self.encoder = encoder
+        self.matrix = matrix
+        self.responses = responses
+        self.categories = categories
+        self.keyword_postings = keyword_postings or {}
+        self.ann = ann
+        self.threshold = float(threshold if threshold is not None
+                               else os.getenv('NLP_DENSE_THRESHOLD', DENSE_SIMILARITY_THRESHOLD))
+
+    def __len__(self):
+        return len(self.responses)
+
+    @classmethod
+    def build(cls, version, encoder, texts, responses, categories, keyword_postings, dtype=None, ann_min_rows=None):
+        dtype = dtype or os.getenv('NLP_EMBEDDING_DTYPE', 'float32')
+        ann_min_rows = int(ann_min_rows or os.getenv('NLP_ANN_MIN_ROWS', 50000))
+        vectors = encoder.fit(texts).encode(texts)
+        ann = IVFIndex.build(vectors) if len(vectors) >= ann_min_rows else None
+        return cls(version, encoder, EmbeddingMatrix.from_vectors(vectors, dtype), responses, categories,
+                   keyword_postings, ann)
+
+    def export(self):
+        encoder_meta, arrays = self.encoder.export()
+        terms, postings = pack_postings(self.keyword_postings)
+        arrays.update(postings)
+        arrays.update(self.matrix.export())
+        if self.ann is not None:
+            arrays.update(self.ann.export())
+        return {
+            'kind': self.kind,
+            'version': self.version,
+            'encoder': encoder_meta,
+            'keyword_terms': terms,
+            'responses': self.responses,
+            'categories': self.categories
+        }, arrays
+
+    @classmethod
+    def attach(cls, meta, arrays):
+        encoder = ENCODERS[meta['encoder']['encoder']].attach(meta['encoder'], arrays)
+        return cls(
+            meta['version'], encoder, EmbeddingMatrix.attach(arrays), meta['responses'], meta['categories'],
+            unpack_postings(meta['keyword_terms'], arrays), IVFIndex.attach(arrays)
+        )
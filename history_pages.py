@@ -0,0 +1,123 @@
+import base64
+import json
+
+from metrics import db_call
+
+HISTORY_FIELDS = ('id', 'user_id', 'user_message', 'bot_response', 'timestamp')
+DEFAULT_FIELDS = ('id', 'user_message', 'bot_response', 'timestamp')
+# Needed to build the next cursor, so always selected
+CURSOR_FIELDS = ('id', 'timestamp')
+# user_id value for callers without a session: only rows with no owner
+ANONYMOUS = object()
+
+
+def encode_cursor(row):
+    payload = json.dumps([row['timestamp'], row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(timestamp, str) or not isinstance(row_id, str):
+        raise ValueError("Invalid cursor")
+    return timestamp, row_id
+
+
+def parse_fields(value):
+    if not value:
+        return list(DEFAULT_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    for field in CURSOR_FIELDS:
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def _scope(query, user_id):
+    if user_id is ANONYMOUS:
+        return query.is_('user_id', 'null')
+    if user_id:
+        return query.eq('user_id', user_id)
+    return query
+
+
+def _page_plan(client, fields, limit, cursor=None, user_id=None):
+    # Keyset pagination on (timestamp desc, id desc): every page is an index range
+    # scan, however deep into the history it is. The pinned PostgREST client has
+    # no or() filter, so rows sharing the cursor's timestamp are fetched first and
+    # the rest of the page comes from strictly older rows.
+    # Yields queries and receives their rows, so the sync and async servers share
+    # the paging logic and only differ in how a query is executed.
+    columns = ','.join(fields)
+    rows = []
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = _scope(client.table('chat_history').select(columns), user_id)
+        rows = yield query.eq('timestamp', timestamp)\
+            .lt('id', row_id)\
+            .order('id', desc=True)\
+            .limit(limit + 1)
+
+    if len(rows) <= limit:
+        query = _scope(client.table('chat_history').select(columns), user_id)
+        if cursor:
+            query = query.lt('timestamp', timestamp)
+        rows += yield query.order('timestamp', desc=True)\
+            .order('id', desc=True)\
+            .limit(limit + 1 - len(rows))
+
+    # One extra row tells us whether another page exists without a count query
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]) if has_more and rows else None
+    return rows, next_cursor
+
+
+def fetch_page(supabase, fields, limit, cursor=None, user_id=None):
+    plan = _page_plan(supabase, fields, limit, cursor, user_id)
+    try:
+        query = next(plan)
+        while True:
+            with db_call('chat_history', 'select'):
+                rows = query.execute().data
+            query = plan.send(rows)
+    except StopIteration as done:
+        return done.value
+
+
+async def fetch_page_async(client, fields, limit, cursor=None, user_id=None):
+    # Same as fetch_page, for the AsyncPostgrestClient used by asgi.py
+    plan = _page_plan(client, fields, limit, cursor, user_id)
+    try:
+        query = next(plan)
+        while True:
+            with db_call('chat_history', 'select'):
+                rows = (await query.execute()).data
+            query = plan.send(rows)
+    except StopIteration as done:
+        return done.value
+
+
+def iter_rows(supabase, fields, page_size=1000, user_id=None):
+    cursor = None
+    while True:
+        rows, cursor = fetch_page(supabase, fields, page_size, cursor, user_id)
+        yield from rows
+        if not cursor:
+            return
+
+
+async def iter_rows_async(client, fields, page_size=1000, user_id=None):
+    cursor = None
+    while True:
+        rows, cursor = await fetch_page_async(client, fields, page_size, cursor, user_id)
+        for row in rows:
+            yield row
+        if not cursor:
+            return
@@ -0,0 +1,97 @@
+import hashlib
+from collections import Counter
+
+from nlp_processor import LOW_CONFIDENCE_MESSAGE, NO_RESPONSES_MESSAGE
+
+# Daily aggregates of chat_history, written by compact_history.py. Analytics
+# read these instead of scanning raw history, which is archived and deleted
+# once it is older than HISTORY_RETENTION_DAYS.
+ROLLUP_TABLE = 'chat_history_daily'
+ROLLUP_FIELDS = ('day', 'messages', 'unmatched', 'users', 'top_categories', 'archived')
+TOP_CATEGORIES = 5
+# Answers given when nothing in the knowledge base matched
+UNMATCHED_MESSAGES = (LOW_CONFIDENCE_MESSAGE, NO_RESPONSES_MESSAGE)
+
+
+def response_id(text):
+    # Stable id for a response text, so archives keep one copy of each answer
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCatalog:
+    # Maps bot_response text back to the knowledge base: response id and category
+    def __init__(self, knowledge_base):
+        self.entries = {
+            response_id(message): {'category': None, 'response': message}
+            for message in UNMATCHED_MESSAGES
+        }
+        for category, data in knowledge_base.items():
+            for response in data['responses']:
+                self.entries[response_id(response)] = {'category': category, 'response': response}
+
+    def lookup(self, text):
+        # (response id, category), or (None, None) for text the knowledge base no longer has
+        rid = response_id(text)
+        entry = self.entries.get(rid)
+        if entry is None or entry['response'] != text:
+            return None, None
+        return rid, entry['category']
+
+
+def rollup_day(day, rows, catalog):
+    categories = Counter()
+    unmatched = 0
+    for row in rows:
+        if row['bot_response'] in UNMATCHED_MESSAGES:
+            unmatched += 1
+            continue
+        categories[catalog.lookup(row['bot_response'])[1] or 'unknown'] += 1
+    return {
+        'day': day,
+        'messages': len(rows),
+        'unmatched': unmatched,
+        'users': len({row['user_id'] for row in rows if row.get('user_id')}),
+        'top_categories': [
+            {'category': category, 'messages': count}
+            for category, count in categories.most_common(TOP_CATEGORIES)
+        ]
+    }
+
+
+def merge_rollups(rollup, late):
+    # Adds rows that reached a day after it was archived. Users and top categories
+    # become approximate: a user can be counted twice, and the earlier rows only
+    # left their top TOP_CATEGORIES behind.
+    categories = Counter()
+    for entry in (rollup['top_categories'] or []) + late['top_categories']:
+        categories[entry['category']] += entry['messages']
+    return {
+        'day': rollup['day'],
+        'messages': rollup['messages'] + late['messages'],
+        'unmatched': rollup['unmatched'] + late['unmatched'],
+        'users': rollup['users'] + late['users'],
+        'top_categories': [
+            {'category': category, 'messages': count}
+            for category, count in categories.most_common(TOP_CATEGORIES)
+        ]
+    }
+
+
+def summarize(rollups):
+    # Totals over a range of daily rollups; top categories are approximate
+    # because each day only keeps its own top TOP_CATEGORIES
+    messages = sum(r['messages'] for r in rollups)
+    unmatched = sum(r['unmatched'] for r in rollups)
+    categories = Counter()
+    for rollup in rollups:
+        for entry in rollup['top_categories'] or []:
+            categories[entry['category']] += entry['messages']
+    return {
+        'messages': messages,
+        'unmatched': unmatched,
+        'unmatched_rate': unmatched / messages if messages else None,
+        'top_categories': [
+            {'category': category, 'messages': count}
+            for category, count in categories.most_common(TOP_CATEGORIES)
+        ]
+    }
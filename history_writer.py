@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import db_call
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    # Moves chat_history inserts off the request path. Rows are queued in memory
+    # (bounded, so a dead database can't exhaust RAM) and a worker thread writes
+    # them as multi-row inserts once batch_size rows are waiting or flush_interval
+    # seconds have passed. Failed batches are retried with exponential backoff and,
+    # if the database stays unreachable, appended to a local JSONL spill file that
+    # is replayed after the next successful flush.
+    def __init__(self, supabase, max_queue=None, batch_size=None, flush_interval=None,
+                 max_retries=None, spill_path=None):
+        self.supabase = supabase
+        self.batch_size = int(batch_size or os.getenv('HISTORY_BATCH_SIZE', 50))
+        self.flush_interval = float(flush_interval or os.getenv('HISTORY_FLUSH_INTERVAL', 1.0))
+        self.max_retries = int(max_retries if max_retries is not None else os.getenv('HISTORY_MAX_RETRIES', 3))
+        self.spill_path = spill_path if spill_path is not None else os.getenv('HISTORY_SPILL_PATH')
+        self.max_queue = int(max_queue or os.getenv('HISTORY_MAX_QUEUE', 10000))
+        self.queue = queue.Queue(maxsize=self.max_queue)
+
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed_batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.flushes = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            if self._thread is None and hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._after_fork)
+            self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+            self._thread.start()
+        self._running = True
+        return self
+
+    def _after_fork(self):
+        # A forked worker (e.g. started from a preloaded master) doesn't inherit
+        # the writer thread. It gets its own queue, locks and thread; rows still
+        # queued at fork time are written by the parent.
+        if not self._running:
+            return
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        # Never blocks the caller; a full queue counts as a drop
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def write_many(self, rows):
+        # Queued as one item and flushed as one multi-row insert (plus anything
+        # already pending), so a batch of chats costs a single round trip
+        rows = list(rows)
+        if not rows:
+            return True
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(rows)
+            return False
+        with self._lock:
+            self.enqueued += len(rows)
+        return True
+
+    def stop(self, timeout=10.0):
+        # Drain whatever is queued, then stop the worker
+        self._running = False
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stopping = item is _STOP
+            if isinstance(item, list):
+                batch.extend(item)
+            elif item is not None and not stopping:
+                batch.append(item)
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline or not batch:
+                deadline = time.monotonic() + self.flush_interval
+            if stopping:
+                return
+
+    def _insert(self, rows):
+        delay = 0.1
+        for attempt in range(self.max_retries + 1):
+            try:
+                with db_call('chat_history', 'insert'):
+                    self.supabase.table('chat_history').insert(rows).execute()
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.warning("Failed to log %d chat history rows: %s", len(rows), e)
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    def _flush(self, rows):
+        started = time.perf_counter()
+        ok = self._insert(rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+            if ok:
+                self.written += len(rows)
+            else:
+                self.failed_batches += 1
+
+        if ok:
+            self._replay_spill()
+        else:
+            self._spill(rows)
+
+    def _spill(self, rows):
+        if not self.spill_path:
+            with self._lock:
+                self.dropped += len(rows)
+            return
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row) + '\n')
+        with self._lock:
+            self.spilled += len(rows)
+
+    def _replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            replay_path = self.spill_path + '.replay'
+            os.replace(self.spill_path, replay_path)
+        with open(replay_path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        os.remove(replay_path)
+
+        for i in range(0, len(rows), self.batch_size):
+            chunk = rows[i:i + self.batch_size]
+            if self._insert(chunk):
+                with self._lock:
+                    self.written += len(chunk)
+                    self.replayed += len(chunk)
+            else:
+                # Database went away again; put the rest back on disk
+                with self._spill_lock:
+                    with open(self.spill_path, 'a', encoding='utf-8') as f:
+                        for row in rows[i:]:
+                            f.write(json.dumps(row) + '\n')
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'replayed': self.replayed,
+                'failed_batches': self.failed_batches,
+                'flushes': self.flushes,
+                'last_flush_ms': self.last_flush_ms,
+                'max_flush_ms': self.max_flush_ms,
+                'avg_flush_ms': self.total_flush_ms / self.flushes if self.flushes else None,
+                'running': self._thread is not None and self._thread.is_alive()
+            }
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def pack_postings(postings):
+    # term -> sorted row array, flattened into two arrays that can be stored raw
+    terms = sorted(postings)
+    rows = [postings[term] for term in terms]
+    return terms, {
+        'keyword_rows': np.concatenate(rows) if rows else np.empty(0, dtype=np.int64),
+        'keyword_offsets': np.cumsum([0] + [len(r) for r in rows], dtype=np.int64)
+    }
+
+
+def unpack_postings(terms, arrays):
+    # Views into the mapped arrays, no copies
+    offsets = arrays['keyword_offsets']
+    return {term: arrays['keyword_rows'][offsets[i]:offsets[i + 1]] for i, term in enumerate(terms)}
+
+
+class IndexStore:
+    # Publishes fitted response indexes to a directory (ideally on tmpfs such as
+    # /dev/shm) so worker processes attach to one memory-mapped copy instead of
+    # each fitting and holding their own. Each generation is written to a
+    # temporary directory and renamed into place, so readers see a complete
+    # generation or none at all.
+    def __init__(self, directory, keep=None):
+        self.directory = directory
+        self.keep = int(keep or os.getenv('NLP_INDEX_KEEP', 3))
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'gen-{key}')
+
+    def _lock_path(self, key):
+        return os.path.join(self.directory, f'.lock-{key}')
+
+    @contextmanager
+    def build_lock(self, key):
+        # Exclusive across processes, so only one worker fits a generation while
+        # the others wait and then attach to what it published. Without fcntl
+        # (Windows) every worker may build, and publish() picks one copy.
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(self._lock_path(key), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, key, meta, arrays):
+        # meta is JSON; arrays are written as raw .npy buffers that load() maps with
+        # np.load(mmap_mode='r') straight from the page cache, so every worker shares
+        # one physical copy. Returns False when another worker already published
+        # this generation.
+        final = self._path(key)
+        if os.path.isdir(final):
+            return False
+
+        tmp = os.path.join(self.directory, f'.tmp-{key}-{os.getpid()}')
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            # Lost the race to another worker; theirs is identical
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        self._prune(final)
+        return True
+
+    def load(self, key):
+        # Returns (meta, arrays) for this generation, or None if it isn't published yet
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            arrays = {
+                name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+                for name in os.listdir(path) if name.endswith('.npy')
+            }
+        except FileNotFoundError:
+            return None
+        return meta, arrays
+
+    def _prune(self, current):
+        # Processes that still map an older generation keep reading it after the
+        # files are unlinked, so removing them here is safe.
+        generations = [
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith('gen-')
+        ]
+        generations.sort(key=os.path.getmtime, reverse=True)
+        for path in generations[self.keep:]:
+            if path != current:
+                shutil.rmtree(path, ignore_errors=True)
+                try:
+                    os.remove(self._lock_path(os.path.basename(path)[len('gen-'):]))
+                except FileNotFoundError:
+                    pass
+                logger.debug("Removed old index generation %s", path)
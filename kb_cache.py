@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+import time
+
+from metrics import db_call
+from nlp_processor import knowledge_base_version
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseSnapshot:
+    # One immutable, fully loaded copy of the knowledge_base table
+    def __init__(self, knowledge_base, version, marker, loaded_at):
+        self.knowledge_base = knowledge_base
+        self.version = version
+        self.marker = marker
+        self.loaded_at = loaded_at
+
+
+class KnowledgeBaseCache:
+    # Keeps the knowledge base in process memory and only goes back to Supabase when
+    # a cheap change probe (row count + latest updated_at) fires, the TTL expires,
+    # or invalidate() is called. Probing and reloading happen on a background
+    # thread (start()), never in a request: get() only returns the current
+    # snapshot. Refreshed snapshots are swapped in with a single attribute
+    # assignment, after on_refresh(snapshot) has prepared anything derived from
+    # them (the NLP index), so requests keep using the old pair until the new one
+    # is ready.
+    def __init__(self, supabase, ttl=None, probe_interval=None, on_refresh=None, page_size=1000):
+        self.supabase = supabase
+        self.on_refresh = on_refresh
+        self.page_size = page_size
+        self.ttl = float(ttl if ttl is not None else os.getenv('KB_CACHE_TTL', 300))
+        self.probe_interval = float(
+            probe_interval if probe_interval is not None else os.getenv('KB_PROBE_INTERVAL', 10)
+        )
+        self.snapshot = None
+        self.has_updated_at = True
+        self._checked_at = 0.0
+        self._invalidated = False
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+        self.refresh_errors = 0
+
+    def _probe(self):
+        # Cheap change marker: one row, one column, plus an exact row count
+        if not self.has_updated_at:
+            return self._count_probe()
+        try:
+            with db_call('knowledge_base', 'probe'):
+                response = self.supabase.table('knowledge_base')\
+                    .select('updated_at', count='exact')\
+                    .order('updated_at', desc=True)\
+                    .limit(1)\
+                    .execute()
+        except Exception as e:
+            if 'updated_at' not in str(e):
+                raise
+            # Table predates the column (added by schema.sql); edits are then only
+            # picked up by the TTL reload or invalidate()
+            logger.warning("knowledge_base has no updated_at column, probing row count only: %s", e)
+            self.has_updated_at = False
+            return self._count_probe()
+        latest = response.data[0]['updated_at'] if response.data else None
+        return (response.count, latest)
+
+    def _count_probe(self):
+        with db_call('knowledge_base', 'probe'):
+            response = self.supabase.table('knowledge_base').select('id', count='exact').limit(1).execute()
+        return (response.count, None)
+
+    def _load(self, marker=None):
+        if marker is None:
+            marker = self._probe()
+        # Paged: PostgREST returns at most max_rows (1000 by default) per request
+        knowledge_base = {}
+        start = 0
+        while True:
+            with db_call('knowledge_base', 'select'):
+                response = self.supabase.table('knowledge_base')\
+                    .select('category, keywords, responses')\
+                    .order('category')\
+                    .range(start, start + self.page_size - 1)\
+                    .execute()
+            for item in response.data:
+                knowledge_base[item['category']] = {
+                    'keywords': item['keywords'],
+                    'responses': item['responses']
+                }
+            if len(response.data) < self.page_size:
+                break
+            start += self.page_size
+        return KnowledgeBaseSnapshot(knowledge_base, knowledge_base_version(knowledge_base), marker, time.time())
+
+    def _refresh(self, force=False):
+        # Caller must hold _refresh_lock
+        now = time.time()
+        snapshot = self.snapshot
+        if snapshot is None or force or self._invalidated or now - snapshot.loaded_at >= self.ttl:
+            self._invalidated = False
+            snapshot = self._load()
+        else:
+            marker = self._probe()
+            if marker != snapshot.marker:
+                snapshot = self._load(marker)
+        if snapshot is not self.snapshot and self.on_refresh is not None:
+            self.on_refresh(snapshot)
+        self._checked_at = now
+        self.snapshot = snapshot
+        return snapshot
+
+    def refresh(self, force=False):
+        with self._refresh_lock:
+            return self._refresh(force)
+
+    def invalidate(self):
+        # The refresher reloads the table right away, regardless of the probe result
+        self._invalidated = True
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        self._running = True
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='kb-cache-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _after_fork(self):
+        # Forked workers don't inherit the refresher thread; each gets its own
+        if not self._running:
+            return
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='kb-cache-refresher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.probe_interval)
+            self._wake.clear()
+            if not self._running:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.warning("Knowledge base refresh failed, serving cached copy: %s", e)
+
+    def get(self):
+        # Only the first call (before anything is loaded) touches the database
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self.refresh()
+        return snapshot
@@ -0,0 +1,49 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+_listener = None
+_handler = None
+
+
+def configure_logging(level=None):
+    # Request threads only put records on a queue; a listener thread does the
+    # formatting and the actual (blocking) write to stderr. Runs when app.py is
+    # imported, so it leaves logging alone if whoever imported it (a test runner,
+    # an embedding server) already set up root handlers.
+    global _listener, _handler
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return
+
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    log_queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root.setLevel(level)
+    _handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_after_fork)
+
+
+def _stop():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _after_fork():
+    # Forked workers don't inherit the listener thread; give each its own queue
+    # and listener so their records are still written
+    global _listener
+    log_queue = queue.Queue(-1)
+    _handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
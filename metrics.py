@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond NLP stages up to slow database calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        # collector() returns [(name, help, {labels} or None, value)] read at scrape time
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        seen = set()
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                continue
+            for name, documentation, labels, value in samples:
+                if value is None:
+                    continue
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {documentation}')
+                    lines.append(f'# TYPE {name} gauge')
+                labels = labels or {}
+                lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+CHAT_STAGE_SECONDS = registry.register(Histogram(
+    'chat_stage_seconds', 'Time spent in each stage of the chat pipeline.', ('stage',)
+))
+DB_CALL_SECONDS = registry.register(Histogram(
+    'db_call_seconds', 'Supabase call latency by table and operation.', ('table', 'operation')
+))
+DB_ERRORS_TOTAL = registry.register(Counter(
+    'db_errors_total', 'Failed Supabase calls by table and operation.', ('table', 'operation')
+))
+AUTH_HASH_SECONDS = registry.register(Histogram(
+    'auth_hash_seconds', 'bcrypt time per operation, excluding queue wait.', ('operation',)
+))
+AUTH_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    'auth_queue_wait_seconds', 'Time a bcrypt job waited for a pool thread.'
+))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_seconds', 'Request latency by route and method.', ('route', 'method')
+))
+HTTP_REQUESTS_TOTAL = registry.register(Counter(
+    'http_requests_total', 'Requests by route, method and status code.', ('route', 'method', 'status')
+))
+
+
+def stage(name):
+    return CHAT_STAGE_SECONDS.time(stage=name)
+
+
+@contextmanager
+def db_call(table, operation):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_ERRORS_TOTAL.inc(table=table, operation=operation)
+        raise
+    finally:
+        DB_CALL_SECONDS.observe(time.perf_counter() - started, table=table, operation=operation)
@@ -0,0 +1,516 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+from caching import LRUCache
+from embeddings import EmbeddingIndex, ENCODERS, create_encoder, missing_dependencies
+from index_store import IndexStore, pack_postings, unpack_postings
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# nltk and scikit-learn each take well over a second to import, so they are
+# loaded on first use rather than when this module is imported.
+
+NO_RESPONSES_MESSAGE = "I'm still learning about supply chain management. Please try asking about inventory, logistics, procurement, or forecasting."
+LOW_CONFIDENCE_MESSAGE = "I'm not sure about that. Could you please rephrase your question about supply chain management?"
+SIMILARITY_THRESHOLD = 0.1
+KEYWORD_WEIGHT = 0.3
+
+# Fast path for word_tokenize: hyphenated words and decimals stay as one token
+# (and are then dropped by the isalnum filter, as with Punkt), while apostrophes
+# split contractions into pieces that the stop word list already removes.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def knowledge_base_version(knowledge_base):
+    # Content hash of the knowledge base, used to decide when the index is stale
+    payload = json.dumps(knowledge_base, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseIndex:
+    # Immutable snapshot of a fitted vectorizer and response matrix for one KB version.
+    # A new instance is built and swapped in whenever the knowledge base changes,
+    # so request threads never see a half-fitted vectorizer.
+    kind = 'tfidf'
+    threshold = SIMILARITY_THRESHOLD
+
+    def __init__(self, version, vectorizer, matrix, responses, categories, keyword_postings=None, postings=None):
+        self.version = version
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.responses = responses
+        self.categories = categories
+        # Column-major copy of the TF-IDF matrix doubles as the inverted index:
+        # column j lists the responses that contain vocabulary term j.
+        if postings is None and matrix is not None:
+            postings = matrix.tocsc()
+        self.postings = postings
+        # Lemmatized category keyword -> indices of every response in that category
+        self.keyword_postings = keyword_postings or {}
+
+    def __len__(self):
+        return len(self.responses)
+
+    def export(self):
+        # (meta, arrays) for IndexStore.publish
+        vocabulary = self.vectorizer.vocabulary_
+        terms, arrays = pack_postings(self.keyword_postings)
+        arrays.update({
+            'data': self.matrix.data,
+            'indices': self.matrix.indices,
+            'indptr': self.matrix.indptr,
+            'postings_data': self.postings.data,
+            'postings_indices': self.postings.indices,
+            'postings_indptr': self.postings.indptr,
+            'idf': self.vectorizer.idf_
+        })
+        return {
+            'kind': self.kind,
+            'version': self.version,
+            'shape': list(self.matrix.shape),
+            # Terms in column order; a list is far smaller on disk than the dict
+            'vocabulary': sorted(vocabulary, key=vocabulary.get),
+            'keyword_terms': terms,
+            'responses': self.responses,
+            'categories': self.categories
+        }, arrays
+
+    @classmethod
+    def attach(cls, meta, arrays):
+        # Zero-copy view of a published generation: the CSR arrays are memory-mapped
+        # and only the vocabulary, responses and categories are per-process objects.
+        from scipy.sparse import csr_matrix, csc_matrix
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        shape = tuple(meta['shape'])
+        matrix = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+        postings = csc_matrix(
+            (arrays['postings_data'], arrays['postings_indices'], arrays['postings_indptr']),
+            shape=shape, copy=False
+        )
+        vectorizer = TfidfVectorizer()
+        vectorizer.vocabulary_ = {term: i for i, term in enumerate(meta['vocabulary'])}
+        vectorizer.idf_ = np.asarray(arrays['idf'])
+        return cls(
+            meta['version'], vectorizer, matrix, meta['responses'], meta['categories'],
+            unpack_postings(meta['keyword_terms'], arrays), postings
+        )
+
+
+# NLP Processing Class
+class NLPProcessor:
+    def __init__(self, tokenizer=None, query_cache_size=None, lemma_cache_size=None, index_store=None, backend=None):
+        self._lemmatizer = None
+        self._stop_words = None
+        self._word_tokenize = None
+        self.tokenizer = tokenizer or os.getenv('NLP_TOKENIZER', 'nltk')
+        if self.tokenizer not in ('nltk', 'regex'):
+            raise ValueError(f"Unknown tokenizer: {self.tokenizer}")
+        # NLP_BACKEND: 'tfidf' (sparse, default) or a dense encoder from embeddings.py
+        self.backend = backend or os.getenv('NLP_BACKEND', 'tfidf')
+        if self.backend != 'tfidf' and self.backend not in ENCODERS:
+            raise ValueError(f"Unknown NLP backend: {self.backend}")
+        missing = missing_dependencies(self.backend) if self.backend != 'tfidf' else []
+        if missing:
+            raise ImportError(
+                f"NLP_BACKEND={self.backend} needs {', '.join(missing)}: pip install -r requirements-transformer.txt"
+            )
+        self.query_cache = LRUCache(int(query_cache_size or os.getenv('NLP_QUERY_CACHE_SIZE', 4096)))
+        self.lemma_cache_size = int(lemma_cache_size or os.getenv('NLP_LEMMA_CACHE_SIZE', 50000))
+        self._lemmas = {}
+        self.lemma_hits = 0
+        self.lemma_misses = 0
+        self.index = None
+        # The generation before self.index, kept so requests still holding the
+        # previous knowledge base snapshot don't trigger a rebuild after a swap
+        self.previous_index = None
+        self._index_lock = threading.Lock()
+        # NLP_INDEX_DIR: share fitted indexes between worker processes (see index_store.py)
+        index_dir = os.getenv('NLP_INDEX_DIR')
+        self.index_store = index_store or (IndexStore(index_dir) if index_dir else None)
+        self.index_source = None
+
+    @property
+    def lemmatizer(self):
+        if self._lemmatizer is None:
+            from nltk.stem import WordNetLemmatizer
+            self._lemmatizer = WordNetLemmatizer()
+        return self._lemmatizer
+
+    @property
+    def stop_words(self):
+        if self._stop_words is None:
+            from nltk.corpus import stopwords
+            self._stop_words = set(stopwords.words('english'))
+        return self._stop_words
+
+    def warm_up(self):
+        # Load NLTK resources up front (the WordNet corpus itself loads on first lemmatize)
+        self.stop_words
+        self.lemmatizer.lemmatize('warming')
+        self.tokenize('warm up')
+
+    def tokenize(self, text):
+        if self.tokenizer == 'regex':
+            return TOKEN_PATTERN.findall(text)
+        if self._word_tokenize is None:
+            from nltk.tokenize import word_tokenize
+            self._word_tokenize = word_tokenize
+        return self._word_tokenize(text)
+
+    def lemmatize(self, token):
+        lemma = self._lemmas.get(token)
+        if lemma is not None:
+            self.lemma_hits += 1
+            return lemma
+        self.lemma_misses += 1
+        lemma = self.lemmatizer.lemmatize(token)
+        if len(self._lemmas) >= self.lemma_cache_size:
+            self._lemmas.clear()
+        self._lemmas[token] = lemma
+        return lemma
+
+    def normalize(self, text):
+        return WHITESPACE_PATTERN.sub(' ', text.lower()).strip()
+
+    def _preprocess(self, normalized):
+        stop_words = self.stop_words
+        # Tokenize
+        tokens = self.tokenize(normalized)
+        # Remove stop words and lemmatize
+        tokens = [self.lemmatize(token) for token in tokens
+                  if token.isalnum() and token not in stop_words]
+        return ' '.join(tokens)
+
+    def preprocess_text(self, text):
+        # Repeated questions differ only in case and spacing, so cache on the normalized form
+        normalized = self.normalize(text)
+        processed = self.query_cache.get(normalized)
+        if processed is None:
+            processed = self._preprocess(normalized)
+            self.query_cache.set(normalized, processed)
+        return processed
+
+    def cache_stats(self):
+        lemma_lookups = self.lemma_hits + self.lemma_misses
+        return {
+            'tokenizer': self.tokenizer,
+            'backend': self.backend,
+            # 'attached' when the current index is mapped from NLP_INDEX_DIR
+            'index_source': self.index_source,
+            'query_cache': self.query_cache.stats(),
+            'lemma_cache': {
+                'size': len(self._lemmas),
+                'maxsize': self.lemma_cache_size,
+                'hits': self.lemma_hits,
+                'misses': self.lemma_misses,
+                'hit_ratio': self.lemma_hits / lemma_lookups if lemma_lookups else None
+            }
+        }
+
+    def build_index(self, knowledge_base, version=None):
+        if version is None:
+            version = knowledge_base_version(knowledge_base)
+
+        responses = []
+        categories = []
+        for category, data in knowledge_base.items():
+            for response in data['responses']:
+                responses.append(response)
+                categories.append(category)
+
+        if not responses:
+            return ResponseIndex(version, None, None, [], [])
+
+        # Responses bypass the query cache so a rebuild doesn't evict real user queries
+        normalized = [self.normalize(r) for r in responses]
+        processed = [self._preprocess(text) for text in normalized]
+        keyword_postings = self._keyword_postings(knowledge_base, categories)
+
+        if self.backend != 'tfidf':
+            encoder = create_encoder(self.backend)
+            texts = processed if encoder.uses_processed_text else normalized
+            try:
+                return EmbeddingIndex.build(version, encoder, texts, responses, categories, keyword_postings)
+            except ValueError:
+                # Every response reduced to stop words, nothing to index
+                return ResponseIndex(version, None, None, [], [])
+
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        # Fit once over the preprocessed responses; queries only call transform()
+        vectorizer = TfidfVectorizer()
+        try:
+            matrix = vectorizer.fit_transform(processed)
+        except ValueError:
+            # Every response reduced to stop words, nothing to index
+            return ResponseIndex(version, None, None, [], [])
+
+        return ResponseIndex(version, vectorizer, matrix.tocsr(), responses, categories, keyword_postings)
+
+    def _keyword_postings(self, knowledge_base, categories):
+        # Lemmatized category keyword -> sorted rows of every response in that category
+        category_rows = {}
+        for i, category in enumerate(categories):
+            category_rows.setdefault(category, []).append(i)
+        keyword_postings = {}
+        for category, data in knowledge_base.items():
+            rows = category_rows.get(category)
+            if not rows:
+                continue
+            for keyword in data.get('keywords') or []:
+                for term in self._preprocess(self.normalize(keyword)).split():
+                    keyword_postings.setdefault(term, set()).update(rows)
+        return {
+            term: np.array(sorted(rows), dtype=np.int64) for term, rows in keyword_postings.items()
+        }
+
+    def get_index(self, knowledge_base, version=None):
+        if version is None:
+            version = knowledge_base_version(knowledge_base)
+
+        for index in (self.index, self.previous_index):
+            if index is not None and index.version == version:
+                return index
+
+        with self._index_lock:
+            # Another thread may have rebuilt the index while we waited
+            index = self.index
+            if index is None or index.version != version:
+                index = self._load_or_build_index(knowledge_base, version)
+                self.previous_index = self.index
+                self.index = index
+        return index
+
+    def _store_key(self, version):
+        # The index depends on preprocessing and the backend as well as content
+        if self.backend == 'tfidf':
+            return f'{version}-{self.tokenizer}'
+        dtype = os.getenv('NLP_EMBEDDING_DTYPE', 'float32')
+        return f'{version}-{self.tokenizer}-{create_encoder(self.backend).tag}-{dtype}'
+
+    def _load_or_build_index(self, knowledge_base, version):
+        if self.index_store is None:
+            self.index_source = 'built'
+            return self.build_index(knowledge_base, version)
+
+        key = self._store_key(version)
+        index = self.attach_index(key)
+        if index is not None:
+            self.index_source = 'attached'
+            return index
+
+        with self.index_store.build_lock(key):
+            # Another worker may have published it while we waited for the lock
+            index = self.attach_index(key)
+            if index is not None:
+                self.index_source = 'attached'
+                return index
+
+            index = self.build_index(knowledge_base, version)
+            self.index_source = 'built'
+            if index.responses:
+                try:
+                    self.index_store.publish(key, *index.export())
+                except OSError as e:
+                    logger.warning("Could not publish index generation %s: %s", key, e)
+                # Serve from the mapped copy, whoever published it, so this worker
+                # doesn't keep a private one
+                index = self.attach_index(key) or index
+        return index
+
+    def attach_index(self, key):
+        parts = self.index_store.load(key)
+        if parts is None:
+            return None
+        meta, arrays = parts
+        if meta.get('kind') == EmbeddingIndex.kind:
+            return EmbeddingIndex.attach(meta, arrays)
+        return ResponseIndex.attach(meta, arrays)
+
+    def _score_candidates(self, processed, index, use_keywords, text=None):
+        # Returns (candidate rows, cosine scores, keyword scores). With TF-IDF the
+        # candidates are the responses sharing at least one term with the query
+        # (everything else scores zero); see _score_dense for the dense backends.
+        if index.kind == EmbeddingIndex.kind:
+            return self._score_dense(processed, text, index, use_keywords)
+        with stage('vectorize'):
+            query = index.vectorizer.transform([processed])
+        with stage('similarity'):
+            return self._rank_candidates(processed, query, index, use_keywords)
+
+    def _keyword_hits(self, processed, index):
+        # Rows whose category has one of the query's terms as a keyword, or None
+        terms = set(processed.split())
+        matched = [index.keyword_postings[t] for t in terms if t in index.keyword_postings]
+        if not matched:
+            return None, []
+        return (np.concatenate(matched), len(terms)), matched
+
+    def _keyword_scores(self, candidates, keyword_hits):
+        # Share of the query's terms that are keywords of each candidate's category
+        keyword_scores = np.zeros(len(candidates))
+        if keyword_hits is not None:
+            rows, term_count = keyword_hits
+            hit_rows, hit_counts = np.unique(rows, return_counts=True)
+            # Both arrays are sorted, so map candidates onto keyword hits without an O(N) pass
+            positions = np.searchsorted(hit_rows, candidates).clip(max=len(hit_rows) - 1)
+            found = hit_rows[positions] == candidates
+            keyword_scores[found] = hit_counts[positions[found]] / term_count
+        return keyword_scores
+
+    def _rank_candidates(self, processed, query, index, use_keywords):
+        term_ids = query.indices
+        postings = index.postings
+        groups = [postings.indices[postings.indptr[t]:postings.indptr[t + 1]] for t in term_ids]
+
+        keyword_hits = None
+        if use_keywords:
+            keyword_hits, matched = self._keyword_hits(processed, index)
+            groups.extend(matched)
+
+        if not groups:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, np.empty(0), np.empty(0)
+
+        candidates = np.unique(np.concatenate(groups))
+        cosine = (index.matrix[candidates] @ query.T).toarray().ravel()
+        return candidates, cosine, self._keyword_scores(candidates, keyword_hits)
+
+    def query_key(self, user_input, processed=None):
+        # What scoring depends on, for response cache keys: the preprocessed text
+        # for TF-IDF and LSA, the normalized raw text for encoders that see stop
+        # words ("in stock" vs "not in stock"). Prefixed with the backend so
+        # caches shared between deployments don't mix them.
+        if processed is None:
+            processed = self.preprocess_text(user_input)
+        if self.backend != 'tfidf' and not ENCODERS[self.backend].uses_processed_text:
+            return f'{self.backend}:{self.normalize(user_input)}'
+        return f'{self.backend}:{processed}'
+
+    def _encode_text(self, processed, text, index):
+        if index.encoder.uses_processed_text or text is None:
+            return processed
+        return self.normalize(text)
+
+    def _score_dense(self, processed, text, index, use_keywords):
+        # Every response has a dense similarity, so the candidates are all rows,
+        # or with an IVF index the rows of the closest clusters plus any keyword matches.
+        with stage('vectorize'):
+            query = index.encoder.encode([self._encode_text(processed, text, index)])[0]
+        with stage('similarity'):
+            keyword_hits, matched = self._keyword_hits(processed, index) if use_keywords else (None, [])
+            if index.ann is None:
+                candidates = np.arange(len(index))
+                cosine = index.matrix.scores(query[None, :]).ravel()
+            else:
+                candidates = np.unique(np.concatenate([index.ann.candidates(query)] + matched))
+                cosine = index.matrix.scores(query[None, :], candidates).ravel()
+            return candidates, cosine, self._keyword_scores(candidates, keyword_hits)
+
+    def search(self, user_input, knowledge_base, version=None, top_k=5, keyword_weight=KEYWORD_WEIGHT):
+        index = self.get_index(knowledge_base, version)
+        if not index.responses or top_k <= 0:
+            return []
+
+        processed = self.preprocess_text(user_input)
+        candidates, cosine, keyword_scores = self._score_candidates(processed, index, True, user_input)
+        if not len(candidates):
+            return []
+
+        scores = (1 - keyword_weight) * cosine + keyword_weight * keyword_scores
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        return [
+            {
+                'response': index.responses[candidates[i]],
+                'category': index.categories[candidates[i]],
+                'score': float(scores[i]),
+                'similarity': float(cosine[i]),
+                'keyword_score': float(keyword_scores[i])
+            }
+            for i in top
+        ]
+
+    def find_best_responses(self, user_inputs, knowledge_base, version=None):
+        # Batch form of find_best_response: one transform and one matrix multiply
+        # for every distinct query. Returns a dict per input with the response,
+        # its category (None below the threshold) and the similarity.
+        index = self.get_index(knowledge_base, version)
+        if not index.responses:
+            return [{'response': NO_RESPONSES_MESSAGE, 'category': None, 'score': 0.0} for _ in user_inputs]
+
+        processed = [self.preprocess_text(text) for text in user_inputs]
+        if index.kind == EmbeddingIndex.kind:
+            keys = [self._encode_text(p, text, index) for p, text in zip(processed, user_inputs)]
+            distinct = list(dict.fromkeys(keys))
+            best_rows, best_scores = self._best_dense(distinct, index)
+        else:
+            keys = processed
+            distinct = list(dict.fromkeys(keys))
+            with stage('vectorize'):
+                queries = index.vectorizer.transform(distinct)
+            with stage('similarity'):
+                scores = (queries @ index.matrix.T).tocsr()
+                # argmax keeps the first maximum in storage order; sorted indices make
+                # ties resolve to the lowest response row, as in find_best_response
+                scores.sort_indices()
+                best_rows = np.asarray(scores.argmax(axis=1)).ravel()
+                best_scores = scores.max(axis=1).toarray().ravel()
+
+        results = {}
+        for i, key in enumerate(distinct):
+            score = float(best_scores[i])
+            if score < index.threshold:
+                results[key] = {'response': LOW_CONFIDENCE_MESSAGE, 'category': None, 'score': score}
+            else:
+                row = int(best_rows[i])
+                results[key] = {'response': index.responses[row], 'category': index.categories[row], 'score': score}
+        return [dict(results[key]) for key in keys]
+
+    def _best_dense(self, texts, index):
+        with stage('vectorize'):
+            queries = index.encoder.encode(texts)
+        with stage('similarity'):
+            if index.ann is None:
+                scores = index.matrix.scores(queries)
+                return scores.argmax(axis=0), scores.max(axis=0)
+            best_rows = np.empty(len(texts), dtype=np.int64)
+            best_scores = np.empty(len(texts), dtype=np.float32)
+            for i, query in enumerate(queries):
+                candidates = index.ann.candidates(query)
+                scores = index.matrix.scores(query[None, :], candidates).ravel()
+                best = int(np.argmax(scores))
+                best_rows[i], best_scores[i] = candidates[best], scores[best]
+            return best_rows, best_scores
+
+    def find_best_response(self, user_input, knowledge_base, version=None):
+        index = self.get_index(knowledge_base, version)
+
+        if not index.responses:
+            return NO_RESPONSES_MESSAGE
+
+        # With TF-IDF, only responses sharing a term with the query can score above zero
+        candidates, similarity_scores, _ = self._score_candidates(
+            self.preprocess_text(user_input), index, False, user_input
+        )
+        if not len(candidates):
+            return LOW_CONFIDENCE_MESSAGE
+        best_match_index = int(np.argmax(similarity_scores))
+
+        if similarity_scores[best_match_index] < index.threshold:
+            return LOW_CONFIDENCE_MESSAGE
+
+        return index.responses[candidates[best_match_index]]
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from metrics import AUTH_HASH_SECONDS, AUTH_QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    # Raised when the hashing pool and its queue are full
+    pass
+
+
+class PasswordHasher:
+    # Runs bcrypt in a small dedicated thread pool so a burst of logins can't take
+    # every request thread (bcrypt releases the GIL while it works). At most
+    # pool_size hashes run at once and queue_size more may wait; anything beyond
+    # that waits up to queue_timeout for a slot and then raises HasherBusy.
+    def __init__(self, rounds=None, pool_size=None, queue_size=None, queue_timeout=None):
+        self.rounds = int(rounds or os.getenv('BCRYPT_ROUNDS', 12))
+        self.pool_size = int(pool_size or os.getenv('HASH_POOL_SIZE', min(4, os.cpu_count() or 1)))
+        self.queue_size = int(queue_size if queue_size is not None else os.getenv('HASH_QUEUE_SIZE', 32))
+        self.queue_timeout = float(queue_timeout if queue_timeout is not None else os.getenv('HASH_QUEUE_TIMEOUT', 0.1))
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(self.pool_size + self.queue_size)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.rehashed = 0
+        self.hash_ms_total = 0.0
+        self.hash_ms_max = 0.0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _run(self, operation, func, *args, block=True):
+        # The async server passes block=False: waiting for a slot would stall its event loop
+        acquired = self._slots.acquire(timeout=self.queue_timeout) if block else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy("Password hashing is saturated, try again shortly")
+        with self._lock:
+            self.in_flight += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                wait_ms = (started - submitted) * 1000
+                hash_ms = (finished - started) * 1000
+                AUTH_QUEUE_WAIT_SECONDS.observe(wait_ms / 1000)
+                AUTH_HASH_SECONDS.observe(hash_ms / 1000, operation=operation)
+                with self._lock:
+                    self.in_flight -= 1
+                    self.completed += 1
+                    self.wait_ms_total += wait_ms
+                    self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+                    self.hash_ms_total += hash_ms
+                    self.hash_ms_max = max(self.hash_ms_max, hash_ms)
+                self._slots.release()
+
+        return self._executor.submit(timed)
+
+    def hash(self, password):
+        future = self._run('hash', bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+        return future.result().decode('utf-8')
+
+    def verify(self, password, hashed):
+        future = self._run('verify', bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        return future.result()
+
+    async def hash_async(self, password):
+        future = self._run('hash', bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds), block=False)
+        return (await asyncio.wrap_future(future)).decode('utf-8')
+
+    async def verify_async(self, password, hashed):
+        future = self._run('verify', bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'), block=False)
+        return await asyncio.wrap_future(future)
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<cost>$<salt+hash>
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def rehash_async(self, password, on_done):
+        # Upgrade a hash to the configured cost without delaying the login response.
+        # Skipped when the pool is busy; the next login will try again.
+        try:
+            future = self._run('rehash', bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds), block=False)
+        except HasherBusy:
+            return False
+
+        def done(f):
+            try:
+                on_done(f.result().decode('utf-8'))
+                with self._lock:
+                    self.rehashed += 1
+            except Exception as e:
+                logger.warning("Failed to re-hash password: %s", e)
+
+        future.add_done_callback(done)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'pool_size': self.pool_size,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'avg_hash_ms': self.hash_ms_total / self.completed if self.completed else None,
+                'max_hash_ms': self.hash_ms_max,
+                'avg_queue_wait_ms': self.wait_ms_total / self.completed if self.completed else None,
+                'max_queue_wait_ms': self.wait_ms_max
+            }
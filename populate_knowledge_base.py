@@ -1,15 +1,26 @@
 from dotenv import load_dotenv
+import argparse
+import csv
+import hashlib
+import itertools
+import json
 import os
+import sys
+import time
 from supabase import create_client
+import requests
+
+from db_schema import check_schema, explain_upsert_error
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+def get_client():
+    # Created on demand so the knowledge base data can be imported without credentials
+    return create_client(
+        os.getenv('SUPABASE_URL'),
+        os.getenv('SUPABASE_KEY')
+    )
 
 # Supply chain management knowledge base
 knowledge_base = {
@@ -105,38 +116,167 @@ knowledge_base = {
     }
 }
 
-def populate_knowledge_base():
+def invalidate_app_cache():
+    # Tell a running app to drop its cached knowledge base right away
+    app_url = os.getenv('APP_URL')
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not app_url or not admin_token:
+        print("ℹ️ APP_URL/ADMIN_TOKEN not set, running apps will pick up changes on their next cache probe")
+        return
+    try:
+        response = requests.post(
+            f"{app_url.rstrip('/')}/api/knowledge-base/invalidate",
+            headers={'X-Admin-Token': admin_token},
+            timeout=5
+        )
+        response.raise_for_status()
+        print("✅ Invalidated app knowledge base cache")
+    except Exception as e:
+        print(f"❌ Error invalidating app cache: {str(e)}")
+
+def content_hash(keywords, responses):
+    payload = json.dumps({'keywords': keywords, 'responses': responses}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def make_row(category, keywords, responses):
+    if not category:
+        raise ValueError("Knowledge base rows need a category")
+    keywords = list(keywords or [])
+    responses = list(responses or [])
+    return {
+        'category': category,
+        'keywords': keywords,
+        'responses': responses,
+        'content_hash': content_hash(keywords, responses)
+    }
+
+def split_list(value):
+    # CSV cells hold lists as "a|b|c"; JSON arrays are passed through
+    if isinstance(value, list):
+        return value
+    value = (value or '').strip()
+    if value.startswith('['):
+        return json.loads(value)
+    return [item.strip() for item in value.split('|') if item.strip()]
+
+def read_rows(path):
+    # Yields rows one at a time so large imports never sit in memory as a whole.
+    # .jsonl: one {"category", "keywords", "responses"} object per line
+    # .csv:   category,keywords,responses columns with "|"-separated lists
+    # .json:  either {category: {keywords, responses}} or a list of row objects
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as f:
+        if extension == '.jsonl':
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    yield make_row(item.get('category'), item.get('keywords'), item.get('responses'))
+        elif extension == '.csv':
+            for item in csv.DictReader(f):
+                yield make_row(item.get('category'), split_list(item.get('keywords')), split_list(item.get('responses')))
+        elif extension == '.json':
+            data = json.load(f)
+            items = data.items() if isinstance(data, dict) else ((item.get('category'), item) for item in data)
+            for category, item in items:
+                yield make_row(category, item.get('keywords'), item.get('responses'))
+        else:
+            raise ValueError(f"Unsupported knowledge base file: {path} (use .json, .jsonl or .csv)")
+
+def builtin_rows():
+    for category, data in knowledge_base.items():
+        yield make_row(category, data['keywords'], data['responses'])
+
+def chunked(rows, size):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def fetch_existing_hashes(supabase, page_size=1000):
+    # One projected, paged scan instead of a SELECT per category
+    hashes = {}
+    start = 0
+    while True:
+        response = supabase.table('knowledge_base')\
+            .select('category, content_hash')\
+            .order('category')\
+            .range(start, start + page_size - 1)\
+            .execute()
+        for item in response.data:
+            hashes[item['category']] = item['content_hash']
+        if len(response.data) < page_size:
+            return hashes
+        start += page_size
+
+def populate_knowledge_base(paths=None, dry_run=False, force=False, chunk_size=500):
     try:
-        # Insert new data
-        for category, data in knowledge_base.items():
-            # Check if category already exists
-            existing = supabase.table('knowledge_base').select('*').eq('category', category).execute()
+        supabase = get_client()
+        # content_hash and the unique category constraint come from schema.sql
+        check_schema(supabase, ['knowledge_base'])
+        existing = {} if force else fetch_existing_hashes(supabase)
+        rows = itertools.chain.from_iterable(read_rows(path) for path in paths) if paths else builtin_rows()
+        
+        started = time.perf_counter()
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        seen = set()
+        for chunk in chunked(rows, chunk_size):
+            changed = []
+            for row in chunk:
+                if row['category'] in seen:
+                    raise ValueError(f"Duplicate category in input: {row['category']}")
+                seen.add(row['category'])
+                
+                if row['category'] not in existing:
+                    action = 'inserted'
+                elif existing[row['category']] != row['content_hash']:
+                    action = 'updated'
+                else:
+                    counts['unchanged'] += 1
+                    continue
+                counts[action] += 1
+                changed.append(row)
+                if dry_run:
+                    print(f"{'+' if action == 'inserted' else '~'} {row['category']}")
             
-            if existing.data:
-                # Update existing category
-                supabase.table('knowledge_base')\
-                    .update({
-                        'keywords': data['keywords'],
-                        'responses': data['responses']
-                    })\
-                    .eq('category', category)\
-                    .execute()
-                print(f"✅ Updated category: {category}")
-            else:
-                # Insert new category
-                supabase.table('knowledge_base').insert({
-                    'category': category,
-                    'keywords': data['keywords'],
-                    'responses': data['responses']
-                }).execute()
-                print(f"✅ Inserted new category: {category}")
+            if changed and not dry_run:
+                # One multi-row statement per chunk, keyed on the unique category column
+                try:
+                    supabase.table('knowledge_base')\
+                        .upsert(changed, on_conflict='category')\
+                        .execute()
+                except Exception as e:
+                    raise explain_upsert_error(e, 'knowledge_base', 'category')
+                print(f"✅ Upserted {len(changed)} categories")
+        
+        elapsed = time.perf_counter() - started
+        summary = f"{counts['inserted']} new, {counts['updated']} changed, {counts['unchanged']} unchanged"
+        if dry_run:
+            print(f"ℹ️ Dry run: {summary} (nothing written)")
+            return counts
+        print(f"✅ Imported knowledge base in {elapsed:.2f}s: {summary}")
         
         # Verify data
-        response = supabase.table('knowledge_base').select('*').execute()
-        print(f"✅ Verified {len(response.data)} categories in knowledge base")
+        response = supabase.table('knowledge_base').select('id', count='exact').limit(1).execute()
+        print(f"✅ Verified {response.count} categories in knowledge base")
+        
+        if counts['inserted'] or counts['updated']:
+            invalidate_app_cache()
+        return counts
         
     except Exception as e:
         print(f"❌ Error: {str(e)}")
 
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import the chatbot knowledge base into Supabase.')
+    parser.add_argument('paths', nargs='*', help='.json, .jsonl or .csv files; defaults to the built-in knowledge base')
+    parser.add_argument('--dry-run', action='store_true', help='show which categories would change without writing')
+    parser.add_argument('--force', action='store_true', help='upsert every category even if its content hash is unchanged')
+    parser.add_argument('--chunk-size', type=int, default=500, help='categories per upsert request')
+    args = parser.parse_args()
+    if populate_knowledge_base(args.paths, dry_run=args.dry_run, force=args.force, chunk_size=args.chunk_size) is None:
+        sys.exit(1)
+
 if __name__ == '__main__':
-    populate_knowledge_base() 
\ No newline at end of file
+    main()
@@ -0,0 +1,215 @@
+import logging
+import math
+import os
+import threading
+import time
+
+from caching import LRUCache, SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+# Route group -> "<requests>/<second|minute|hour>", overridable with RATE_LIMIT_<GROUP>
+# ("off" disables a group). The bucket holds <requests> tokens and refills over the period.
+# A request takes one token, except batches, which take one per message.
+DEFAULT_LIMITS = {
+    'chat': '60/minute',
+    'chat_batch': '1000/minute',
+    'auth': '10/minute'
+}
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+class RateLimit:
+    def __init__(self, spec):
+        try:
+            count, period = spec.split('/')
+            self.capacity = int(count)
+            self.period = PERIODS[period.strip()]
+        except (ValueError, KeyError):
+            raise ValueError(f"Invalid rate limit: {spec!r} (expected e.g. 60/minute)")
+        if self.capacity < 1:
+            raise ValueError(f"Invalid rate limit: {spec!r}")
+        self.rate = self.capacity / self.period
+
+
+def refill(tokens, updated, now, limit):
+    return min(limit.capacity, tokens + max(0.0, now - updated) * limit.rate)
+
+
+class MemoryStore:
+    # Buckets for this process only; idle clients fall out of the LRU
+    blocking = False
+
+    def __init__(self, maxsize=None):
+        self.buckets = LRUCache(int(maxsize or os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000)))
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self.buckets.get(key) or (limit.capacity, now)
+            tokens = refill(tokens, updated, now, limit)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets.set(key, (tokens, now))
+        return allowed, tokens
+
+
+class SQLiteStore:
+    # Buckets shared by the workers on one host, in a local SQLite file. Stands
+    # in for Redis when there is no server to point at.
+    blocking = True
+
+    def __init__(self, path):
+        self.path = path
+        self._connections = SQLiteConnections(path)
+        self._takes = 0
+        self._connections.connect().execute(
+            'create table if not exists rate_limits '
+            '(key text primary key, tokens real not null, updated real not null)'
+        )
+
+    def take(self, key, limit, cost=1):
+        conn = self._connections.connect()
+        now = time.time()
+        # Immediate transaction: the read-modify-write is atomic across processes
+        conn.execute('begin immediate')
+        try:
+            row = conn.execute('select tokens, updated from rate_limits where key = ?', (key,)).fetchone()
+            tokens = refill(*row, now, limit) if row else limit.capacity
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                'insert or replace into rate_limits (key, tokens, updated) values (?, ?, ?)',
+                (key, tokens, now)
+            )
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                # Buckets idle for longer than the longest period are full again
+                conn.execute('delete from rate_limits where updated < ?', (now - max(PERIODS.values()),))
+            conn.execute('commit')
+        except Exception:
+            conn.execute('rollback')
+            raise
+        return allowed, tokens
+
+
+# KEYS[1] bucket; ARGV rate, capacity, cost, now. Returns {allowed, tokens}.
+TOKEN_BUCKET_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisStore:
+    blocking = True
+
+    def __init__(self, url, prefix='chatbot:ratelimit:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, limit, cost=1):
+        allowed, tokens = self.script(keys=[self.prefix + key], args=[limit.rate, limit.capacity, cost, time.time()])
+        return bool(allowed), float(tokens)
+
+
+def create_store():
+    # RATE_LIMIT_BACKEND: "memory" (default, per process), "sqlite" or "redis"
+    backend = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteStore(os.getenv('RATE_LIMIT_PATH', 'rate_limits.sqlite3'))
+    if backend == 'redis':
+        return RedisStore(os.getenv('RATE_LIMIT_URL', 'redis://localhost:6379/0'))
+    if backend != 'memory':
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return MemoryStore()
+
+
+class RateLimitResult:
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset', 'retry_after')
+
+    def __init__(self, allowed, limit, tokens, cost):
+        self.allowed = allowed
+        self.limit = limit.capacity
+        self.remaining = int(tokens)
+        # Seconds until the bucket is full again / until `cost` tokens are available
+        self.reset = math.ceil((limit.capacity - tokens) / limit.rate)
+        self.retry_after = 0 if allowed else math.ceil((cost - tokens) / limit.rate)
+
+    def headers(self):
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset)
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(max(1, self.retry_after))
+        return headers
+
+
+class RateLimiter:
+    # Token bucket per (route group, client). A failing shared store lets
+    # requests through rather than taking the API down with it.
+    def __init__(self, store=None, limits=None):
+        self.store = store or MemoryStore()
+        self.enabled = os.getenv('RATE_LIMIT_ENABLED', '1') != '0'
+        limits = dict(limits or {})
+        self.limits = {}
+        for group, default in DEFAULT_LIMITS.items():
+            spec = limits.get(group) or os.getenv(f'RATE_LIMIT_{group.upper()}', default)
+            if spec.lower() != 'off':
+                self.limits[group] = RateLimit(spec)
+        self._lock = threading.Lock()
+        self.allowed = {}
+        self.limited = {}
+        self.store_errors = 0
+
+    def check(self, group, client, cost=1):
+        # None when the group isn't limited (or the store failed)
+        limit = self.limits.get(group)
+        if not self.enabled or limit is None:
+            return None
+        # A request costing more than the bucket holds would never be allowed;
+        # it empties a full bucket instead
+        cost = min(cost, limit.capacity)
+        try:
+            allowed, tokens = self.store.take(f'{group}:{client}', limit, cost)
+        except Exception as e:
+            with self._lock:
+                self.store_errors += 1
+            logger.warning("Rate limit store failed, allowing request: %s", e)
+            return None
+        with self._lock:
+            counts = self.allowed if allowed else self.limited
+            counts[group] = counts.get(group, 0) + 1
+        return RateLimitResult(allowed, limit, tokens, cost)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'backend': type(self.store).__name__,
+                'limits': {group: f'{limit.capacity}/{limit.period}s' for group, limit in self.limits.items()},
+                'allowed': dict(self.allowed),
+                'limited': dict(self.limited),
+                'store_errors': self.store_errors
+            }
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from caching import LRUCache, SingleFlight, SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteBackend:
+    # Shared cache for workers on one host, backed by a local SQLite file.
+    # Stands in for Redis when there is no cache server to point at.
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._connections = SQLiteConnections(path)
+        self._writes = 0
+        with self._connections.connect() as conn:
+            conn.execute(
+                'create table if not exists response_cache '
+                '(key text primary key, value text not null, expires_at real not null)'
+            )
+
+    def get(self, key):
+        row = self._connections.connect().execute(
+            'select value from response_cache where key = ? and expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        conn = self._connections.connect()
+        now = time.time()
+        conn.execute(
+            'insert or replace into response_cache (key, value, expires_at) values (?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl)
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            conn.execute('delete from response_cache where expires_at <= ?', (now,))
+
+
+class RedisBackend:
+    def __init__(self, url, ttl, prefix='chatbot:response:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(self.ttl))
+
+
+def create_backend(ttl):
+    # RESPONSE_CACHE_BACKEND: unset/"none" for in-process only, "sqlite" or "redis"
+    backend = os.getenv('RESPONSE_CACHE_BACKEND', 'none').lower()
+    if backend == 'sqlite':
+        return SQLiteBackend(os.getenv('RESPONSE_CACHE_PATH', 'response_cache.sqlite3'), ttl)
+    if backend == 'redis':
+        return RedisBackend(os.getenv('RESPONSE_CACHE_URL', 'redis://localhost:6379/0'), ttl)
+    if backend != 'none':
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend}")
+    return None
+
+
+class ResponseCache:
+    # Two-tier cache of chat answers: an in-process LRU in front of an optional
+    # shared backend. Keys include the knowledge base version, so a KB change
+    # simply stops matching old entries instead of needing an explicit flush.
+    def __init__(self, maxsize=None, ttl=None, backend=None):
+        self.ttl = float(ttl or os.getenv('RESPONSE_CACHE_TTL', 600))
+        self.local = LRUCache(int(maxsize or os.getenv('RESPONSE_CACHE_SIZE', 2048)), ttl=self.ttl)
+        self.backend = backend
+        # Identical queries that miss at the same time are computed once
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+        self.shared_hits = 0
+        self.misses = 0
+        self.backend_errors = 0
+        self.compute_ms = 0.0
+        self.hit_ms = 0.0
+
+    @staticmethod
+    def make_key(version, processed_query, variant=''):
+        return f"{version}:{variant}:{processed_query}"
+
+    def _get_shared(self, key):
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            with self._lock:
+                self.backend_errors += 1
+            logger.warning("Shared response cache read failed: %s", e)
+            return None
+
+    def _set_shared(self, key, value):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            with self._lock:
+                self.backend_errors += 1
+            logger.warning("Shared response cache write failed: %s", e)
+
+    def get_or_compute(self, key, compute):
+        started = time.perf_counter()
+        value = self.local.get(key)
+        if value is not None:
+            with self._lock:
+                self.hit_ms += (time.perf_counter() - started) * 1000
+            return value
+
+        value = self._get_shared(key)
+        if value is not None:
+            self.local.set(key, value)
+            with self._lock:
+                self.shared_hits += 1
+                self.hit_ms += (time.perf_counter() - started) * 1000
+            return value
+
+        return self.flights.do(key, lambda: self._compute(key, compute, started))
+
+    def _compute(self, key, compute, started):
+        value = compute()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.misses += 1
+            self.compute_ms += elapsed_ms
+        self.local.set(key, value)
+        self._set_shared(key, value)
+        return value
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        local = self.local.stats()
+        with self._lock:
+            hits = local['hits'] + self.shared_hits
+            lookups = hits + self.misses
+            avg_compute_ms = self.compute_ms / self.misses if self.misses else None
+            avg_hit_ms = self.hit_ms / hits if hits else None
+            saved_ms = None
+            if avg_compute_ms is not None and avg_hit_ms is not None:
+                # Estimated: every hit would otherwise have cost an average miss
+                saved_ms = max(0.0, hits * (avg_compute_ms - avg_hit_ms))
+            return {
+                'backend': type(self.backend).__name__ if self.backend else None,
+                'size': local['size'],
+                'maxsize': local['maxsize'],
+                'ttl': self.ttl,
+                'local_hits': local['hits'],
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': hits / lookups if lookups else None,
+                'coalesced': self.flights.coalesced,
+                'backend_errors': self.backend_errors,
+                'avg_compute_ms': avg_compute_ms,
+                'avg_hit_ms': avg_hit_ms,
+                'latency_saved_ms': saved_ms
+            }
@@ -0,0 +1,67 @@
+-- Schema for the chatbot. Idempotent: run it on a new project or after an
+-- upgrade, in the Supabase SQL editor or with psql -f schema.sql.
+-- setup_db.py and populate_knowledge_base.py check for it and stop until it has run.
+
+create table if not exists public.users (
+    id uuid default uuid_generate_v4() primary key,
+    email text unique not null,
+    password text not null,
+    username text not null,
+    created_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+create table if not exists public.knowledge_base (
+    id uuid default uuid_generate_v4() primary key,
+    category text not null unique,
+    keywords text[] not null,
+    responses text[] not null,
+    content_hash text,
+    created_at timestamp with time zone default timezone('utc'::text, now()),
+    updated_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+-- Existing deployments: the app's cache probe orders by updated_at, and bulk
+-- imports upsert on category and skip unchanged content
+alter table public.knowledge_base add column if not exists updated_at
+    timestamp with time zone default timezone('utc'::text, now());
+alter table public.knowledge_base add column if not exists content_hash text;
+create unique index if not exists knowledge_base_category_key on public.knowledge_base (category);
+
+-- Bump updated_at on every change so the app's cache probe notices edits
+create or replace function public.touch_updated_at() returns trigger as $$
+begin
+    new.updated_at = timezone('utc'::text, now());
+    return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists knowledge_base_touch_updated_at on public.knowledge_base;
+create trigger knowledge_base_touch_updated_at
+    before update on public.knowledge_base
+    for each row execute function public.touch_updated_at();
+
+create table if not exists public.chat_history (
+    id uuid default uuid_generate_v4() primary key,
+    user_id uuid references public.users(id),
+    user_message text not null,
+    bot_response text not null,
+    timestamp timestamp with time zone default timezone('utc'::text, now())
+);
+
+-- Keyset pagination for /api/chat-history, per user and across all users
+create index if not exists chat_history_user_timestamp_idx
+    on public.chat_history (user_id, timestamp desc, id desc);
+create index if not exists chat_history_timestamp_idx
+    on public.chat_history (timestamp desc, id desc);
+
+-- Daily rollups maintained by compact_history.py; analytics read these
+-- instead of scanning chat_history, whose old rows are archived and deleted
+create table if not exists public.chat_history_daily (
+    day date primary key,
+    messages integer not null,
+    unmatched integer not null,
+    users integer not null,
+    top_categories jsonb not null default '[]'::jsonb,
+    archived boolean not null default false,
+    updated_at timestamp with time zone default timezone('utc'::text, now())
+);
@@ -1,5 +1,7 @@
-// API Configuration
-const API_URL = 'http://localhost:5000/api';
+// API Configuration: same origin when served by the app, local server when opened as a file
+const API_URL = window.location.protocol.startsWith('http')
+    ? `${window.location.origin}/api`
+    : 'http://localhost:5000/api';
 
 // Knowledge base for supply chain management
 const knowledgeBase = {
@@ -203,30 +205,103 @@ async function handleUserInput() {
     addMessage(message, 'user');
     userInput.value = '';
 
+    let botMessage = null;
     try {
-        // First try to get response from server
-        const response = await fetch(`${API_URL}/chat`, {
+        // Streamed reply: the answer is rendered as soon as its event arrives,
+        // category and alternatives follow when the server sends them
+        const response = await fetch(`${API_URL}/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
+            credentials: 'include',
             body: JSON.stringify({ message }),
         });
 
-        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(`Chat request failed with status ${response.status}`);
+        }
 
-        if (response.ok) {
-            addMessage(data.response, 'bot');
-        } else {
-            // If server returns error, fallback to local knowledge base
-            const localResponse = findLocalResponse(message);
-            addMessage(localResponse, 'bot');
+        await readEvents(response, (event, data) => {
+            if (event === 'answer') {
+                botMessage = addMessage(data.response, 'bot');
+            } else if (event === 'metadata' && botMessage) {
+                addMessageMeta(botMessage, data);
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
+
+        if (!botMessage) {
+            throw new Error('Stream ended without an answer');
         }
     } catch (error) {
         console.error('Chat error:', error);
-        // If server is unreachable, fallback to local knowledge base
-        const localResponse = findLocalResponse(message);
-        addMessage(localResponse, 'bot');
+        // If the server is unreachable or fails before answering, fall back to the local knowledge base
+        if (!botMessage) {
+            const localResponse = findLocalResponse(message);
+            addMessage(localResponse, 'bot');
+        }
+    }
+}
+
+// Reads a text/event-stream response and calls onEvent(event, data) for each event
+async function readEvents(response, onEvent) {
+    const handleBlock = (block) => {
+        let event = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (dataLines.length) {
+            onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    };
+
+    if (!response.body || !response.body.getReader) {
+        // No streaming support: handle the whole body at once
+        (await response.text()).split('\n\n').forEach(handleBlock);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        blocks.forEach(handleBlock);
+    }
+    if (buffer.trim()) {
+        handleBlock(buffer);
+    }
+}
+
+function addMessageMeta(messageDiv, metadata) {
+    const meta = document.createElement('div');
+    meta.classList.add('message-meta');
+    if (metadata.category) {
+        meta.textContent = `${metadata.category.replace(/_/g, ' ')} · score ${metadata.score.toFixed(2)}`;
+    }
+    if (metadata.alternatives && metadata.alternatives.length) {
+        const list = document.createElement('ul');
+        metadata.alternatives.forEach(alternative => {
+            const item = document.createElement('li');
+            item.textContent = alternative.response;
+            list.appendChild(item);
+        });
+        meta.appendChild(list);
+    }
+    if (meta.childNodes.length) {
+        messageDiv.querySelector('.message-content').appendChild(meta);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
     }
 }
 
@@ -252,12 +327,15 @@ function findLocalResponse(message) {
 
 async function loadChatHistory() {
     try {
-        const response = await fetch(`${API_URL}/chat-history`);
+        // Only the columns we render; older pages are available via data.next_cursor
+        const response = await fetch(`${API_URL}/chat-history?limit=50&fields=user_message,bot_response`, {
+            credentials: 'include',
+        });
         const data = await response.json();
 
         if (response.ok) {
             chatMessages.innerHTML = '';
-            data.forEach(chat => {
+            data.messages.forEach(chat => {
                 addMessage(chat.user_message, 'user');
                 addMessage(chat.bot_response, 'bot');
             });
@@ -284,6 +362,7 @@ function addMessage(message, sender) {
     
     // Scroll to bottom
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
 }
 
 // UI Functions
@@ -0,0 +1,21 @@
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+# Production entry point: the async server (asgi.py) under uvicorn.
+# `python app.py` is only the Flask development server.
+load_dotenv()
+
+if __name__ == '__main__':
+    uvicorn.run(
+        'asgi:app',
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', 5000)),
+        workers=int(os.getenv('WEB_CONCURRENCY', 1)),
+        backlog=int(os.getenv('BACKLOG', 2048)),
+        timeout_keep_alive=int(os.getenv('KEEP_ALIVE_TIMEOUT', 5)),
+        proxy_headers=True,
+        # app.py configures logging; keep uvicorn from replacing it
+        log_config=None
+    )
@@ -1,5 +1,8 @@
 from supabase import create_client
 import os
+import sys
+
+from db_schema import SCHEMA_FILE, check_schema, explain_upsert_error
 
 # Supabase credentials
 SUPABASE_URL = "https://efqxsznftybekniauuhg.supabase.co"
@@ -10,39 +13,9 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def create_tables():
     try:
-        # SQL commands to create tables
-        create_users_table = """
-        create table if not exists public.users (
-            id uuid default uuid_generate_v4() primary key,
-            email text unique not null,
-            password text not null,
-            username text not null,
-            created_at timestamp with time zone default timezone('utc'::text, now())
-        );
-        """
-
-        create_knowledge_base_table = """
-        create table if not exists public.knowledge_base (
-            id uuid default uuid_generate_v4() primary key,
-            category text not null,
-            keywords text[] not null,
-            responses text[] not null,
-            created_at timestamp with time zone default timezone('utc'::text, now())
-        );
-        """
-
-        create_chat_history_table = """
-        create table if not exists public.chat_history (
-            id uuid default uuid_generate_v4() primary key,
-            user_id uuid references public.users(id),
-            user_message text not null,
-            bot_response text not null,
-            timestamp timestamp with time zone default timezone('utc'::text, now())
-        );
-        """
-
-        # Execute table creation
-        print("Creating tables...")
+        # Tables, columns, indexes and triggers are created by schema.sql; this only
+        # checks that it has been run
+        print(f"Checking tables (schema: {SCHEMA_FILE})...")
         
         # Create users table
         supabase.table('users').select('*').limit(1).execute()
@@ -50,15 +23,24 @@ def create_tables():
 
         # Create knowledge base table
         supabase.table('knowledge_base').select('*').limit(1).execute()
-        print("Knowledge base table exists or created successfully!")
+        check_schema(supabase, ['knowledge_base'])
+        print("Knowledge base table exists and is up to date!")
 
         # Create chat history table
         supabase.table('chat_history').select('*').limit(1).execute()
         print("Chat history table exists or created successfully!")
 
+        # Rollup table: only compact_history.py needs it, so a missing one
+        # doesn't stop the sample data from being added
+        try:
+            supabase.table('chat_history_daily').select('*').limit(1).execute()
+            print("Chat history rollup table exists or created successfully!")
+        except Exception as e:
+            print(f"Warning: chat_history_daily is not available, run {SCHEMA_FILE} before compact_history.py: {str(e)}")
+
         # Insert sample knowledge base data
         print("Adding sample knowledge base data...")
-        supabase.table('knowledge_base').insert([
+        sample = supabase.table('knowledge_base').upsert([
             {
                 'category': 'inventory',
                 'keywords': ['inventory', 'stock', 'storage', 'warehouse'],
@@ -77,13 +59,21 @@ def create_tables():
                     "Based on current data, I recommend optimizing delivery routes."
                 ]
             }
-        ]).execute()
+        ], on_conflict='category')
+        try:
+            sample.execute()
+        except Exception as e:
+            raise explain_upsert_error(e, 'knowledge_base', 'category')
         print("Sample data added successfully!")
 
         print("All tables and sample data created successfully!")
+        return True
         
     except Exception as e:
         print(f"Error: {str(e)}")
+    return False
 
 if __name__ == "__main__":
-    create_tables() 
\ No newline at end of file
+    # Nonzero exit so cron and CI notice a database that isn't set up
+    if not create_tables():
+        sys.exit(1) 
\ No newline at end of file
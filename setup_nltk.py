@@ -1,15 +1,35 @@
 import nltk
 
+# NLTK packages the app needs, mapped to the resource nltk.data.find() looks up
+REQUIRED_NLTK_DATA = {
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+}
+
+def verify_nltk_data():
+    # Local check only, never touches the network; returns the missing packages
+    missing = []
+    for package, resource in REQUIRED_NLTK_DATA.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(package)
+    return missing
+
 def download_nltk_data():
     try:
         # Download required NLTK data
-        nltk.download('punkt')
-        nltk.download('stopwords')
-        nltk.download('wordnet')
-        nltk.download('averaged_perceptron_tagger')
-        print("✅ Successfully downloaded NLTK data")
+        missing = verify_nltk_data()
+        for package in missing:
+            if not nltk.download(package):
+                raise RuntimeError(f"Failed to download {package}")
+        if missing:
+            print(f"✅ Successfully downloaded NLTK data: {', '.join(missing)}")
+        else:
+            print("✅ NLTK data already installed")
     except Exception as e:
         print(f"❌ Error downloading NLTK data: {str(e)}")
 
 if __name__ == '__main__':
-    download_nltk_data() 
\ No newline at end of file
+    download_nltk_data()
@@ -0,0 +1,85 @@
+import os
+
+from caching import LRUCache
+from metrics import db_call
+
+# Never select the password hash unless we are checking it
+USER_COLUMNS = 'id, email, username'
+
+
+class User:
+    # Flask-Login user. Implements the UserMixin interface directly so the class can
+    # use __slots__; UserMixin has none, which would give every instance a __dict__.
+    __slots__ = ('id', 'email', 'username')
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_data):
+        self.id = user_data['id']
+        self.email = user_data['email']
+        self.username = user_data['username']
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
+    def __hash__(self):
+        return hash(self.get_id())
+
+
+class UserCache:
+    # Caches User objects for Flask-Login's user_loader so an authenticated request
+    # is a dictionary lookup instead of a round trip to the users table.
+    def __init__(self, supabase, maxsize=None, ttl=None):
+        self.supabase = supabase
+        self.cache = LRUCache(
+            int(maxsize or os.getenv('USER_CACHE_SIZE', 10000)),
+            ttl=float(ttl or os.getenv('USER_CACHE_TTL', 300))
+        )
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        user = self.cache.get(user_id)
+        if user is not None:
+            return user
+        with db_call('users', 'select'):
+            response = self.supabase.table('users').select(USER_COLUMNS).eq('id', user_id).execute()
+        return self._remember(user_id, response.data)
+
+    async def get_async(self, user_id, client):
+        # For the async server: same cache, misses go through its AsyncPostgrestClient
+        user_id = str(user_id)
+        user = self.cache.get(user_id)
+        if user is not None:
+            return user
+        with db_call('users', 'select'):
+            response = await client.table('users').select(USER_COLUMNS).eq('id', user_id).execute()
+        return self._remember(user_id, response.data)
+
+    def _remember(self, user_id, rows):
+        if not rows:
+            return None
+        user = User(rows[0])
+        self.cache.set(user_id, user)
+        return user
+
+    def put(self, user):
+        self.cache.set(user.get_id(), user)
+
+    def invalidate(self, user_id):
+        self.cache.delete(str(user_id))
+
+    def stats(self):
+        return self.cache.stats()